@@ -0,0 +1,165 @@
+"""
+Batch mode: runs the ingest -> model -> push -> derive pipeline for several datasets at once.
+
+Every manifest entry runs in its own spawned process, so PROJECT_ID / DATASET_ID, Google and
+Kaggle credentials, the download directory and the log file are isolated per run. A shared
+scheduler hands out CPU slots to the transform stage and I/O slots to the fetch, push and
+derive stages, so uploads of one business unit overlap with the transforms of another.
+
+manifest.json :-
+    {
+        "max_workers": 4,
+        "cpu_slots": 2,
+        "io_slots": 8,
+        "runs": [
+            {
+                "name": "emea",
+                "dataset": "rohitsahoo/sales-forecasting",
+                "csv_file": "train.csv",
+                "project_id": "my-project",
+                "dataset_id": "supply_chain_emea",
+                "credentials": "/secrets/emea-sa.json",
+                "kaggle_config_dir": "/secrets/kaggle-emea",
+                "derive": ["mart_inventory_analysis", "kpi_lead_time"]
+            }
+        ]
+    }
+
+usage :-
+    python batch_pipeline.py manifest.json --runs-dir ./runs
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+# note: modules.* are imported inside run_pipeline, after the run's environment is in place,
+# because they read PROJECT_ID / DATASET_ID and build their clients at import time
+
+def _isolate(run, run_dir):
+    env = {
+        "PROJECT_ID": run.get("project_id"),
+        "DATASET_ID": run["dataset_id"],
+        "GOOGLE_APPLICATION_CREDENTIALS": run.get("credentials"),
+        "KAGGLE_CONFIG_DIR": run.get("kaggle_config_dir")
+    }
+    for key, value in env.items():
+        if value:
+            os.environ[key] = value
+
+    # configured before the modules import, so their basicConfig calls become no-ops and everything lands here
+    logging.basicConfig(
+        filename=os.path.join(run_dir, "pipeline.log"),
+        level=logging.INFO,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        force=True
+    )
+
+@contextmanager
+def _stage(name, slots, timings):
+    wait_start = time.perf_counter()
+    with slots:
+        start = time.perf_counter()
+        logging.info(f"Stage '{name}' started after waiting {start - wait_start:.2f}s for a slot")
+        yield
+        timings[name] = round(time.perf_counter() - start, 3)
+        logging.info(f"Stage '{name}' finished in {timings[name]}s")
+
+def run_pipeline(run, run_dir, cpu_slots, io_slots):
+    os.makedirs(run_dir, exist_ok=True)
+    _isolate(run, run_dir)
+
+    from modules.data_extraction_and_transformation import create_fact_and_dimensions, fetch_kaggle_data, preprocess_data
+    from modules.lineage import refresh_stale
+    from modules.pushing_to_bigquery import push_to_bigquery
+
+    download_path = os.path.join(run_dir, "data")
+    csv_path = os.path.join(download_path, run.get("csv_file", "train.csv"))
+    timings = {}
+    result = {"name": run["name"], "dataset_id": run["dataset_id"], "timings": timings, "status": "failed"}
+
+    with _stage("ingest", io_slots, timings):
+        fetch_kaggle_data(run["dataset"], download_path)
+    if not os.path.exists(csv_path):
+        result["error"] = f"{csv_path} was not downloaded"
+        return result
+
+    with _stage("model", cpu_slots, timings):
+        df = preprocess_data(csv_path)
+        df_fact, df_orders, df_shipping, df_customers, df_regions, df_products = (
+            create_fact_and_dimensions(df) if df is not None else (None,) * 6
+        )
+    if df_fact is None:
+        result["error"] = "preprocessing or modelling failed, see pipeline.log"
+        return result
+
+    tables = {
+        'fact_sales': df_fact,
+        'dim_orders': df_orders,
+        'dim_shipping': df_shipping,
+        'dim_customers': df_customers,
+        'dim_regions': df_regions,
+        'dim_products': df_products
+    }
+    with _stage("push", io_slots, timings):
+        pushed = push_to_bigquery(tables)
+    if not pushed:
+        result["error"] = "push to BigQuery failed, see pipeline.log"
+        return result
+
+    with _stage("derive", io_slots, timings):
+        result["rebuilt"] = refresh_stale(run.get("derive"))
+
+    result["status"] = "ok"
+    return result
+
+def run_batch(manifest, runs_dir):
+    runs = manifest["runs"]
+    names = [run["name"] for run in runs]
+    if len(set(names)) != len(names):
+        raise ValueError("run names in the manifest must be unique, they name the run directories")
+
+    max_workers = manifest.get("max_workers", min(len(runs), os.cpu_count() or 1))
+    context = multiprocessing.get_context("spawn")
+
+    with context.Manager() as manager:
+        # the shared scheduler: transforms are capped at the core count, uploads and warehouse jobs mostly wait
+        cpu_slots = manager.BoundedSemaphore(manifest.get("cpu_slots", os.cpu_count() or 1))
+        io_slots = manager.BoundedSemaphore(manifest.get("io_slots", 2 * max_workers))
+
+        # one fresh process per run, modules are never reused with another run's environment
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, max_tasks_per_child=1) as executor:
+            futures = {
+                executor.submit(run_pipeline, run, os.path.abspath(os.path.join(runs_dir, run["name"])), cpu_slots, io_slots): run["name"]
+                for run in runs
+            }
+            results = []
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append({"name": futures[future], "status": "failed", "error": str(e)})
+                print(json.dumps(results[-1]))
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ETL pipeline for every dataset in a manifest")
+    parser.add_argument("manifest", help="path to the JSON manifest")
+    parser.add_argument("--runs-dir", default="./runs", help="per-run data and log directories go here")
+    args = parser.parse_args()
+
+    with open(args.manifest) as f:
+        manifest = json.load(f)
+    results = run_batch(manifest, args.runs_dir)
+
+    failed = [result["name"] for result in results if result["status"] != "ok"]
+    print(f"{len(results) - len(failed)}/{len(results)} runs succeeded" + (f", failed: {failed}" if failed else ""))
+    raise SystemExit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+"""
+Concurrent-session load test for the dashboard.
+
+Starts one `streamlit run main.py` server and drives N headless sessions against it over
+Streamlit's websocket protocol, each clicking through the Home / ETL / EDA / Analysis flows the
+way a browser tab would. The sessions share the server's st.cache_resource state, prefetcher,
+single-flight coalescing and BigQuery clients exactly like analysts on one deployment, so the
+report answers "N people open Analysis -> KPIs at the same time": render latency per
+interaction, queries the server sent, how many were coalesced and the server's peak RSS.
+
+The server starts with empty caches; the first round of every session is reported as "cold",
+later rounds as "warm". Queries per interaction come from a separate single-session probe on its
+own fresh server that waits for the prefetcher to go idle after every interaction, so each count
+includes the background prefetches that interaction started.
+
+usage :-
+    python load_test.py --sessions 10 --rounds 3
+    python load_test.py --sessions 10 --emulator-host http://localhost:9050 --json report.json
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+# note: streamlit and modules.* are imported inside the server process (--serve), after the
+# query modules have been wrapped, so the app's queries are counted where they are sent
+
+APP_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "main.py"))
+
+# modules whose module-level `client` issues queries on behalf of the dashboard
+QUERY_MODULES = [
+    "modules.aggregation_tabs",
+    "modules.clustering_and_partitioning",
+    "modules.data_mart_tabs",
+    "modules.kpi_tabs",
+    "modules.lineage",
+    "modules.order_sketches"
+]
+
+# interaction -> widget steps, ("radio", label, value) or ("button", label)
+FLOWS = {
+    "home": [("radio", "Go to", "Home")],
+    "etl": [("radio", "Go to", "ETL")],
+    "eda_inventory": [
+        ("radio", "Go to", "EDA"),
+        ("radio", "Select Analysis Section:", "Inventory Analysis"),
+        ("button", "Fetch Data Marts & Generate Analysis Report")
+    ],
+    "eda_order_fulfillment": [
+        ("radio", "Go to", "EDA"),
+        ("radio", "Select Analysis Section:", "Order Fulfillment"),
+        ("button", "Fetch Data Marts & Generate Analysis Report")
+    ],
+    "eda_shipping_logistics": [
+        ("radio", "Go to", "EDA"),
+        ("radio", "Select Analysis Section:", "Shipping Logistics"),
+        ("button", "Fetch Data Marts & Generate Analysis Report")
+    ],
+    "analysis_kpis": [
+        ("radio", "Go to", "Analysis"),
+        ("radio", "Select Analysis Type", "KPIs"),
+        ("button", "Invoke Procedures & Generate Analysis Report")
+    ],
+    "analysis_aggregations": [
+        ("radio", "Go to", "Analysis"),
+        ("radio", "Select Analysis Type", "Aggregations"),
+        ("button", "Invoke Procedures & Generate Analysis Report")
+    ]
+}
+
+class CountingClient:
+    # thin proxy over bigquery.Client that counts submitted query jobs
+    def __init__(self, client, counter):
+        self._client = client
+        self._counter = counter
+
+    def query(self, *args, **kwargs):
+        self._counter.increment()
+        return self._client.query(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+class QueryCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def increment(self):
+        with self._lock:
+            self.value += 1
+
+def import_query_modules(emulator_host=None):
+    """
+    imports the query modules up front so main.py reuses them from sys.modules,
+    with an emulator host the module clients are built against it with anonymous credentials
+    """
+    if emulator_host:
+        from google.auth.credentials import AnonymousCredentials
+        from google.cloud import bigquery
+
+        os.environ["BIGQUERY_EMULATOR_HOST"] = emulator_host
+        real_client = bigquery.Client
+        project = os.getenv("PROJECT_ID") or "local"
+        bigquery.Client = lambda *args, **kwargs: real_client(
+            project=kwargs.pop("project", project), credentials=AnonymousCredentials(), **kwargs
+        )
+        try:
+            modules = [importlib.import_module(name) for name in QUERY_MODULES]
+        finally:
+            bigquery.Client = real_client
+    else:
+        modules = [importlib.import_module(name) for name in QUERY_MODULES]
+
+    counter = QueryCounter()
+    for module in modules:
+        module.client = CountingClient(module.client, counter)
+    return counter
+
+def track_prefetchers():
+    # main.py builds its Prefetcher on first render, remember it so interactions can wait for it
+    prefetch = importlib.import_module("modules.prefetch")
+    instances = []
+
+    class TrackedPrefetcher(prefetch.Prefetcher):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            instances.append(self)
+
+    prefetch.Prefetcher = TrackedPrefetcher
+    return instances
+
+def write_server_stats(stats_file, counter, prefetchers, interval=0.1):
+    # runs in the server process, the harness reads the file instead of reaching into the server
+    from modules.single_flight import coalesced_count
+    while True:
+        stats = {
+            "queries": counter.value,
+            "coalesced_queries": coalesced_count(),
+            "prefetch_pending": sum(prefetcher.snapshot()["pending"] for prefetcher in prefetchers),
+            # ru_maxrss is in KiB on Linux
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+        with open(stats_file + ".tmp", "w") as f:
+            json.dump(stats, f)
+        os.replace(stats_file + ".tmp", stats_file)
+        time.sleep(interval)
+
+def serve(port, stats_file, emulator_host=None):
+    """
+    the server under test: `streamlit run main.py` in this process, with counting clients in place
+    """
+    counter = import_query_modules(emulator_host)
+    prefetchers = track_prefetchers()
+    threading.Thread(target=write_server_stats, args=(stats_file, counter, prefetchers), daemon=True).start()
+
+    from streamlit.web import cli
+    cli.main(args=["run", APP_PATH, "--server.headless", "true", "--server.port", str(port),
+                   "--server.fileWatcherType", "none", "--browser.gatherUsageStats", "false"], prog_name="streamlit")
+
+class Server:
+    def __init__(self, port, emulator_host=None, startup_timeout=120):
+        self.port = port
+        self._workdir = tempfile.mkdtemp(prefix="load_test_")
+        self.stats_file = os.path.join(self._workdir, "server_stats.json")
+        self.log_file = os.path.join(self._workdir, "server.log")
+        command = [sys.executable, os.path.abspath(__file__), "--serve", str(port), "--stats-file", self.stats_file]
+        if emulator_host:
+            command += ["--emulator-host", emulator_host]
+        with open(self.log_file, "w") as log:
+            self._process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+        self._wait_healthy(startup_timeout)
+
+    def _wait_healthy(self, timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"server exited with code {self._process.returncode}, see {self.log_file}")
+            try:
+                with urllib.request.urlopen(f"http://localhost:{self.port}/_stcore/health", timeout=1) as response:
+                    if response.status == 200 and os.path.exists(self.stats_file):
+                        return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError(f"server not healthy after {timeout}s, see {self.log_file}")
+
+    def stats(self):
+        with open(self.stats_file) as f:
+            return json.load(f)
+
+    def wait_idle(self, timeout):
+        # idle once no prefetch is queued or running and the query count has stopped moving
+        deadline = time.monotonic() + timeout
+        last = None
+        while time.monotonic() < deadline:
+            stats = self.stats()
+            if stats["prefetch_pending"] == 0 and last is not None and stats["queries"] == last["queries"]:
+                return stats
+            last = stats
+            time.sleep(0.25)
+        return self.stats()
+
+    def stop(self):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+class HeadlessSession:
+    """
+    one browser tab: sends rerun requests with the current widget values over /_stcore/stream and
+    reads the rendered elements back, so radios and buttons are found by label like in the UI
+    """
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.radios, self.buttons = {}, {}
+        self._values = {}
+
+    async def __aenter__(self):
+        import websockets
+        self._ws = await websockets.connect(self.url, subprotocols=["streamlit"], max_size=None, open_timeout=self.timeout)
+        await self.rerun()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._ws.close()
+
+    async def rerun(self, triggers=()):
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = ""
+        back_msg.rerun_script.widget_states.widgets.extend(list(self._values.values()) + list(triggers))
+        await self._ws.send(back_msg.SerializeToString())
+        await asyncio.wait_for(self._read_run(), self.timeout)
+
+    async def _read_run(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        radios, buttons, exceptions = {}, {}, []
+        while True:
+            forward_msg = ForwardMsg()
+            forward_msg.ParseFromString(await self._ws.recv())
+            kind = forward_msg.WhichOneof("type")
+            if kind == "delta" and forward_msg.delta.WhichOneof("type") == "new_element":
+                element = forward_msg.delta.new_element
+                element_type = element.WhichOneof("type")
+                if element_type == "radio":
+                    radios[element.radio.label] = element.radio
+                elif element_type == "button":
+                    buttons[element.button.label] = element.button
+                elif element_type == "exception":
+                    exceptions.append(element.exception.message)
+            elif kind == "script_finished":
+                if forward_msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                if forward_msg.script_finished == ForwardMsg.FINISHED_WITH_COMPILE_ERROR:
+                    raise RuntimeError("main.py failed to compile")
+                break
+        self.radios, self.buttons = radios, buttons
+        if exceptions:
+            raise RuntimeError(exceptions[0])
+
+    async def set_radio(self, label, value):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        radio = self._find(self.radios, label)
+        if "raw_value" in radio.DESCRIPTOR.fields_by_name:
+            # newer Streamlit sends the selected option itself, older releases its index
+            self._values[radio.id] = WidgetState(id=radio.id, string_value=value)
+        else:
+            self._values[radio.id] = WidgetState(id=radio.id, int_value=list(radio.options).index(value))
+        await self.rerun()
+
+    async def click(self, label):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        button = self._find(self.buttons, label)
+        await self.rerun(triggers=[WidgetState(id=button.id, trigger_value=True)])
+
+    @staticmethod
+    def _find(widgets, label):
+        if label not in widgets:
+            raise LookupError(f"widget '{label}' not rendered")
+        return widgets[label]
+
+async def run_flow(session, steps):
+    for step in steps:
+        if step[0] == "radio":
+            await session.set_radio(step[1], step[2])
+        else:
+            await session.click(step[1])
+
+async def run_session(url, flows, rounds, timeout, samples, errors):
+    # one analyst replaying the flows; the first round is cold, later ones warm
+    try:
+        async with HeadlessSession(url, timeout) as session:
+            for round_index in range(rounds):
+                phase = "cold" if round_index == 0 else "warm"
+                for name in flows:
+                    start = time.perf_counter()
+                    try:
+                        await run_flow(session, FLOWS[name])
+                    except Exception as e:
+                        errors.append((phase, name, str(e) or type(e).__name__))
+                        continue
+                    samples[phase].setdefault(name, []).append(time.perf_counter() - start)
+    except Exception as e:
+        errors.append(("cold", "connect", str(e) or type(e).__name__))
+
+async def run_sessions(url, sessions, flows, rounds, timeout):
+    samples, errors = {"cold": {}, "warm": {}}, []
+    await asyncio.gather(*(run_session(url, flows, rounds, timeout, samples, errors) for _ in range(sessions)))
+    return samples, errors
+
+async def probe_queries(url, server, flows, timeout):
+    # a lone session, every count read once the prefetches its interaction started are done
+    counts = {}
+    async with HeadlessSession(url, timeout) as session:
+        before = server.wait_idle(timeout)["queries"]
+        for name in flows:
+            try:
+                await run_flow(session, FLOWS[name])
+            except Exception:
+                pass
+            after = server.wait_idle(timeout)["queries"]
+            counts[name] = after - before
+            before = after
+    return counts
+
+def percentile(values, pct):
+    # nearest-rank percentile, good enough for latency reporting
+    ordered = sorted(values)
+    rank = max(1, round(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+def _latency_stats(latencies):
+    return {
+        "samples": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1) if latencies else None
+    }
+
+def run_load_test(sessions, rounds, flows, timeout, port=8599, emulator_host=None):
+    url = f"ws://localhost:{port}/_stcore/stream"
+
+    # per-interaction query counts, on a server of their own so the timed run also starts cold
+    server = Server(port, emulator_host)
+    try:
+        query_counts = asyncio.run(probe_queries(url, server, flows, timeout))
+    finally:
+        server.stop()
+
+    server = Server(port, emulator_host)
+    try:
+        start = time.perf_counter()
+        samples, errors = asyncio.run(run_sessions(url, sessions, flows, rounds, timeout))
+        elapsed = time.perf_counter() - start
+        stats = server.wait_idle(timeout)
+    finally:
+        server.stop()
+
+    report = {
+        "sessions": sessions,
+        "rounds": rounds,
+        "elapsed_s": round(elapsed, 3),
+        "total_queries": stats["queries"],
+        "coalesced_queries": stats["coalesced_queries"],
+        "server_peak_rss_mb": stats["peak_rss_mb"],
+        "errors": len(errors),
+        "queries_per_interaction": query_counts,
+        "phases": {
+            phase: {name: _latency_stats(samples[phase].get(name, [])) for name in flows}
+            for phase in (("cold", "warm") if rounds > 1 else ("cold",))
+        }
+    }
+    return report, errors
+
+def print_report(report, errors):
+    print(f"{report['sessions']} sessions x {report['rounds']} rounds in {report['elapsed_s']}s against one server, "
+          f"{report['total_queries']} queries ({report['coalesced_queries']} coalesced), "
+          f"server peak RSS {report['server_peak_rss_mb']} MB, {report['errors']} errors")
+    for phase, interactions in report["phases"].items():
+        print(f"\n[{phase}]")
+        print(f"{'interaction':<24}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+        for name, stats in interactions.items():
+            print(f"{name:<24}{stats['samples']:>5}{str(stats['p50_ms']):>10}{str(stats['p95_ms']):>10}"
+                  f"{str(stats['p99_ms']):>10}{str(report['queries_per_interaction'].get(name)):>9}")
+    for phase, name, message in errors[:10]:
+        print(f"error in {name} ({phase}): {message}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the Streamlit dashboard")
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent headless sessions on one server")
+    parser.add_argument("--rounds", type=int, default=1, help="times each session replays the flows, the first round runs cold")
+    parser.add_argument("--flows", nargs="+", choices=list(FLOWS), default=list(FLOWS), help="interactions to script")
+    parser.add_argument("--timeout", type=float, default=120, help="per-rerun timeout in seconds")
+    parser.add_argument("--port", type=int, default=8599, help="port for the server under test")
+    parser.add_argument("--emulator-host", help="BigQuery emulator endpoint to use as the local query backend")
+    parser.add_argument("--json", help="also write the report to this path")
+    # internal: the server process started by the harness
+    parser.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--stats-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.stats_file, args.emulator_host)
+        return
+
+    report, errors = run_load_test(args.sessions, args.rounds, args.flows, args.timeout, args.port, args.emulator_host)
+    print_report(report, errors)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,235 @@
+import threading
 import time
+import uuid
 import streamlit as st
 from dotenv import load_dotenv
 import plotly.express as px
-from modules.aggregation_tabs import create_aggregation_procedures, execute_all_aggregations
+from functools import partial
+from modules.aggregation_tabs import AGGREGATION_PROCEDURES, aggregation_loaders, iter_all_aggregations
 from modules.data_extraction_and_transformation import *
-from modules.data_mart_tabs import create_data_marts, fetch_data_mart
-from modules.kpi_tabs import create_kpi_procedures, execute_all_kpis
+from modules.data_mart_tabs import fetch_data_mart, fetch_sampled_data_mart
+from modules.kpi_tabs import KPI_PROCEDURES, iter_all_kpis
+from modules.lineage import fetch_table_versions, refresh_stale, source_versions
+from modules.olap_cube import CUBE_DIMENSIONS, SalesCube
+from modules.order_sketches import (APPROX_ROLLUPS, DEFAULT_RELATIVE_ERROR, SKETCH_TABLES, approx_distinct_orders,
+                                    build_order_sketches, iter_approx_rollups, precision_for_error)
+from modules.prefetch import Prefetcher
 from modules.pushing_to_bigquery import push_to_bigquery
-
-@st.cache_data
-def get_data_mart(mart_name):
+from modules.sampling import DEFAULT_SAMPLE_PERCENT
+from modules import single_flight
+from modules.streaming_ingest import StreamingIngest
+
+EDA_MARTS = {
+    "Inventory Analysis": "mart_inventory_analysis",
+    "Order Fulfillment": "mart_order_fulfillment",
+    "Shipping Logistics": "mart_shipping_logistics"
+}
+
+STREAMING_DROP_DIR = "./data/incoming"
+
+@st.cache_resource
+def get_prefetcher():
+    # one result cache + background pool shared by every session
+    return Prefetcher()
+
+def prefetch_requester():
+    # the prefetcher is shared, switching sections only cancels what this session queued
+    if "prefetch_requester" not in st.session_state:
+        st.session_state.prefetch_requester = uuid.uuid4().hex
+    return st.session_state.prefetch_requester
+
+def load_data_mart(mart_name):
+    # rebuilds the mart only if one of its upstream tables changed since its last build
+    refresh_stale([mart_name])
     return fetch_data_mart(mart_name)
 
+def data_mart_loaders(mart_names, versions):
+    return {("mart", mart_name, versions.get(mart_name)): partial(load_data_mart, mart_name) for mart_name in mart_names}
+
+CACHED_TABLES = list(EDA_MARTS.values()) + list(KPI_PROCEDURES.values()) + list(AGGREGATION_PROCEDURES.values())
+
+@st.cache_data(ttl=10, show_spinner=False)
+def recent_source_versions():
+    # for prefetch keys only, a slightly old version just means the warmed entry is never served
+    try:
+        return source_versions(CACHED_TABLES)
+    except Exception:
+        return {}
+
+def current_source_versions():
+    # checked before any cached result is served, a cache key built from these misses once the data moved on
+    try:
+        return source_versions(CACHED_TABLES)
+    except Exception:
+        # without the metadata lookup nothing cached can be trusted, so every key misses
+        return {table: time.time() for table in CACHED_TABLES}
+
+def preview_controls():
+    # sidebar toggle for the sampled preview mode, returns the sample percent or None for full precision
+    if not st.sidebar.toggle("Fast preview (sampled)"):
+        return None
+    return st.sidebar.select_slider("Sample of fact_sales", options=[1, 5, 10, 25, 50], value=DEFAULT_SAMPLE_PERCENT, format_func=lambda p: f"{p}%")
+
+def render_sampling_notice(df):
+    sampling = df.attrs.get("sampling")
+    if not sampling:
+        return
+    drawn = "whole orders" if sampling["sampled_by"] == "order_key" else "storage blocks"
+    notice = f"Preview over {sampling['sampled_fraction']:.1%} of fact_sales ({sampling['sample_percent']}% requested, sampled by {drawn}). "
+    if sampling["scaled_columns"]:
+        notice += (f"{', '.join(sampling['scaled_columns'])} are scaled up to full-table estimates; the whole-table sales total "
+                   f"would be within about ±{sampling['total_sales_error_95']:.1%} (95%), smaller groups are less precise. "
+                   "Other columns are as measured on the sample. ")
+    else:
+        notice += "Nothing is scaled up, figures are as measured on the sampled rows. "
+    st.info(notice + "Turn off fast preview for exact figures.")
+
+@st.cache_resource
+def get_sales_state():
+    # Explorer tables and cube shared by every session, loaded on first use and grown by streaming appends
+    return {"lock": threading.Lock(), "tables": None, "fact_version": None, "cube": None}
+
+def get_sales_tables():
+    state = get_sales_state()
+    with state["lock"]:
+        if state["tables"] is None:
+            state["tables"] = {table_name: fetch_data_mart(table_name) for table_name in ["fact_sales", "dim_orders", "dim_shipping", "dim_customers", "dim_regions", "dim_products"]}
+            # read after the tables, so appends that landed before the read are not added a second time
+            try:
+                state["fact_version"] = fetch_table_versions().get("fact_sales")
+            except Exception:
+                state["fact_version"] = None
+        return state["tables"]
+
+def get_sales_cube():
+    tables = get_sales_tables()
+    state = get_sales_state()
+    with state["lock"]:
+        if state["cube"] is None:
+            state["cube"] = SalesCube.from_tables(tables)
+        return state["cube"]
+
+def reset_sales_state():
+    state = get_sales_state()
+    with state["lock"]:
+        state["tables"] = state["fact_version"] = state["cube"] = None
+
+def append_to_sales_state(df_fact, new_dims, fact_version):
+    # grows the loaded tables and the cube by one streamed batch instead of reloading all six tables
+    state = get_sales_state()
+    with state["lock"]:
+        if state["tables"] is None:
+            return
+        if fact_version is not None and state["fact_version"] is not None and fact_version <= state["fact_version"]:
+            return
+        tables = dict(state["tables"])
+        for table_name, df in {**new_dims, "fact_sales": df_fact}.items():
+            tables[table_name] = pd.concat([tables[table_name], df], ignore_index=True)
+        state["tables"] = tables
+        if state["cube"] is not None:
+            state["cube"].append(df_fact, tables)
+
+def local_order_sketches(tables, dimension, relative_error):
+    """
+    per (order date, member) HLL sketches of order_key for one cube dimension, built once per session
+    and table version; returns the sketches and the (date, member) -> label function to merge them by
+    """
+    cache = st.session_state.setdefault("order_sketches", {})
+    cache_key = (id(tables['fact_sales']), len(tables['fact_sales']), dimension, relative_error)
+    if cache_key not in cache:
+        table_name, key, column = CUBE_DIMENSIONS[dimension]
+        if dimension == "Order Month":
+            sketches = build_order_sketches(tables['fact_sales'], tables['dim_orders'], relative_error=relative_error)
+            label = lambda order_date, member: pd.Timestamp(order_date).strftime('%Y-%m')
+        else:
+            # sketched per label rather than per surrogate key, far fewer (date, member) sketches to hold
+            df_members = tables[table_name][[key, column]].drop_duplicates(subset=key).rename(columns={column: "member"})
+            df_fact = tables['fact_sales'][['order_key', key]].merge(df_members, on=key, how='left').fillna({"member": "Unknown"})
+            sketches = build_order_sketches(df_fact, tables['dim_orders'], "member", relative_error)
+            label = lambda order_date, member: member
+        cache[cache_key] = (sketches, label)
+    return cache[cache_key]
+
+def date_range_controls(container, label):
+    # empty selection means every date, a single date means from that day on
+    selected = container.date_input(label, value=[])
+    start_date = selected[0] if len(selected) > 0 else None
+    end_date = selected[1] if len(selected) > 1 else None
+    return start_date, end_date
+
+@st.cache_resource
+def get_streaming_ingest():
+    # one ingest per process, whichever session starts it; cached results are keyed by source versions,
+    # so only the Explorer's in-memory tables need to hear about appends
+    return StreamingIngest(drop_dir=STREAMING_DROP_DIR, on_append=append_to_sales_state).start()
+
+def render_kpi(kpi_name, df_kpi):
+    st.subheader(f"{kpi_name.replace('_', ' ').title()}")
+    render_sampling_notice(df_kpi)
+    st.dataframe(df_kpi)
+
+    # KPI Charts
+    if "total_sales" in df_kpi.columns:
+        fig = px.bar(df_kpi, x=df_kpi.columns[0], y="total_sales", text_auto=True)
+        st.plotly_chart(fig, use_container_width=True)
+        st.markdown("""
+        Office Supplies dominate total sales by a significant margin compared to Technology and Furniture. The lower sales in Technology and Furniture could indicate either lower demand or higher price sensitivity in these categories.
+        """)
+
+    if "total_revenue" in df_kpi.columns:
+        fig = px.pie(df_kpi, names=df_kpi.columns[0], values="total_revenue", hole=0.3)
+        st.plotly_chart(fig, use_container_width=True)
+        st.markdown("""
+        Technology generates the most revenue, but Office Supplies and Furniture contribute nearly equal shares. Despite lower sales volume, Technology has a higher revenue share, indicating higher-priced items or better margins.
+        """)
+
+    if "avg_order_value" in df_kpi.columns:
+        fig = px.bar(df_kpi, x=df_kpi.columns[0], y="avg_order_value", text_auto=True)
+        st.plotly_chart(fig, use_container_width=True)
+        st.markdown("""
+        Technology leads with the highest average order value, followed by Furniture. Office Supplies has the lowest average order value, indicating smaller transaction sizes in that category.
+        """)
+
+    if "lead_time_days" in df_kpi.columns:
+        fig = px.histogram(df_kpi, x="lead_time_days", nbins=20)
+        st.plotly_chart(fig, use_container_width=True)
+        st.markdown(
+            """
+            The distribution of lead times shows that most orders are fulfilled within 4 days, with a noticeable peak at this point. Lead times of 2 and 5 days are also common, while 0, 1, and 7 days are less frequent, suggesting variability in processing efficiency.
+            """
+        )
+
+    if "avg_order_frequency" in df_kpi.columns:
+        # kept off df_kpi, the frame is shared through the result cache
+        frequency_category = df_kpi["avg_order_frequency"].apply(
+            lambda x: "1" if x == 1 else "1-2" if x <= 2 else "2-3" if x <= 3 else "3+"
+        )
+        freq_counts = frequency_category.value_counts().reset_index()
+        freq_counts.columns = ["Frequency Range", "Count"]
+
+        fig = px.pie(freq_counts, names="Frequency Range", values="Count", hole=0.4)
+        st.plotly_chart(fig, use_container_width=True)
+        st.markdown("""
+        The vast majority (97.9%) of customers placed only one order, while a small fraction (2.1%) placed between one and two orders. This suggests low repeat purchase behavior.
+        """)
+
+def render_aggregation(agg_name, df_agg):
+    st.subheader(f"{agg_name.replace('_', ' ').title()}")
+    st.dataframe(df_agg)
+
+    # Aggregation Charts
+    if "total_sales" in df_agg.columns:
+        fig = px.bar(df_agg, x=df_agg.columns[0], y="total_sales", text_auto=True)
+        st.plotly_chart(fig, use_container_width=True)
+
+    if "total_orders" in df_agg.columns:
+        fig = px.bar(df_agg, x=df_agg.columns[0], y="total_orders", text_auto=True)
+        st.plotly_chart(fig, use_container_width=True)
+
+    if "total_revenue" in df_agg.columns:
+        fig = px.pie(df_agg, names=df_agg.columns[0], values="total_revenue", hole=0.3)
+        st.plotly_chart(fig, use_container_width=True)
+
 def main():
     """
     pipeline flow :-
@@ -42,6 +260,7 @@ def main():
     st.sidebar.title("Supply Chain Analysis")
     # main sections
     section = st.sidebar.radio("Go to", ["Home", "ETL", "EDA", "Schema", "Analysis"])
+    prefetcher = get_prefetcher()
 
     # Landing Page
     if section == "Home":
@@ -104,11 +323,13 @@ def main():
         if st.session_state.step_1_done:
             with st.form("glance_data"):
                 choice = st.radio("Want to glance at the data?", ("Yes", "No"))
+                preview_rows = st.number_input("Rows", min_value=1, max_value=1000, value=5)
+                # a random sample streams the whole file in chunks, the first rows read only what they show
+                preview_kind = st.radio("Show", ("First rows", "Random sample"), horizontal=True)
                 submitted = st.form_submit_button("Submit")
 
             if submitted and choice == 'Yes':
-                sample_df = pd.read_csv('data/train.csv')
-                st.dataframe(sample_df.head())
+                st.dataframe(read_csv_preview('data/train.csv', n_rows=preview_rows, sample=preview_kind == "Random sample"))
 
         # 2 & 3. preprocessing + creating facts and dims
         if st.session_state.step_1_done:
@@ -141,6 +362,8 @@ def main():
                     'dim_regions': df_regions,
                     'dim_products': df_products
                 }
+                # the explorer cube is rebuilt from the new tables on next use
+                st.session_state.pop("sales_cube", None)
                 st.session_state.step_2_3_done = True
 
         # 4. pushing to bigquery
@@ -148,103 +371,130 @@ def main():
             if st.button("Push data to bigquery"):
                 with st.spinner("Pushing data to bigquery..."):
                     push_to_bigquery(st.session_state.tables)
+                reset_sales_state()
+                prefetcher.invalidate()
+                # the replaced dims hand out new surrogate keys, streaming must stop using the old ones
+                if st.session_state.get("streaming_started"):
+                    get_streaming_ingest().reload_dimensions()
                 st.success("Data pushed to bigquery successfully!")
                 st.session_state.step_4_done = True
+
+        # 5. streaming ingest, order files dropped into STREAMING_DROP_DIR are appended as they arrive
+        if st.session_state.step_4_done:
+            if st.button("Start streaming ingest"):
+                get_streaming_ingest()
+                st.success(f"Watching {STREAMING_DROP_DIR} for new order files")
+                st.session_state.streaming_started = True
     
     elif section == 'EDA':
             # Subsection for EDA
         eda_section = st.sidebar.radio("Select Analysis Section:", 
                                     ["Inventory Analysis", "Order Fulfillment", "Shipping Logistics"])
+        sample_percent = preview_controls()
+        # analysts usually walk through all three subsections, so the other two marts are warmed now
+        if sample_percent is None:
+            prefetcher.prefetch(data_mart_loaders([mart for section_name, mart in EDA_MARTS.items() if section_name != eda_section], recent_source_versions()), requester=prefetch_requester())
 
         if st.button("Fetch Data Marts & Generate Analysis Report"):
-            create_data_marts()
-            df_inventory = get_data_mart("mart_inventory_analysis")
-            df_order_fulfillment = get_data_mart("mart_order_fulfillment")
-            df_shipping_logistics = get_data_mart("mart_shipping_logistics")
-            st.success("Data Marts Fetched!")
-
-            # Inventory Analysis
-            if eda_section == "Inventory Analysis":
-                st.subheader("Inventory Analysis")
-                st.markdown("**Overview of inventory sales and order distribution.**")
-                st.dataframe(df_inventory.head(10))  # Show limited rows
-
-                # Pie Chart - Sales Revenue by Category
-                st.subheader("Sales Revenue Distribution by Category")
-                fig = px.pie(df_inventory, names="Category", values="total_sales_revenue", hole=0.3)
-                st.plotly_chart(fig, use_container_width=True)
-                st.markdown("""
-                The Technology category accounts for 37.5% of the total sales revenue, making it the largest contributor. 
-                Furniture follows closely with 31.8%, while Office Supplies contributes 30.6%, indicating a relatively 
-                balanced revenue distribution across all three categories.
-                """)
-
-                # Bar Chart - Total Orders by Sub-Category
-                st.subheader("Total Orders by Sub-Category")
-                df_top_subcategories = df_inventory.groupby("Sub-Category")["total_orders"].sum().nlargest(10).reset_index()
-                fig = px.bar(df_top_subcategories, x="Sub-Category", y="total_orders", text_auto=True)
-                fig.update_layout(xaxis_tickangle=-45)
-                st.plotly_chart(fig, use_container_width=True)
-                st.markdown("""
-                **Binders** and **Paper** lead in total orders with **1,529** and **1,420** orders respectively, indicating high demand. **Furnishings** and **Phones** follow, while **Labels** and **Appliances** show the **lowest order volumes**, suggesting less customer interest in these sub-categories.
-                """)
-
-            # Order Fulfillment
-            elif eda_section == "Order Fulfillment":
-                st.subheader("Order Fulfillment")
-                st.markdown("**Analysis of order fulfillment performance across different regions.**")
-                st.dataframe(df_order_fulfillment.head(10))
-
-                # Bar Chart - Total Sales by Region
-                st.subheader("Total Sales by Region")
-                fig = px.bar(df_order_fulfillment, 
-                            x="region_name", 
-                            y="total_sales") 
-                st.plotly_chart(fig, use_container_width=True)
-
-                st.markdown("""
-                The **West** and **East** regions lead in total sales, with both nearing **800k**, while the **Central** region follows at around **500k**. The **South** region records the **lowest sales** at approximately **400k**, indicating a significant regional disparity.
-                """)
-
-                # Pie Chart - Top 5 Customers by Sales
-                st.subheader("Top 5 Customers by Sales Contribution")
-                top_customers = df_order_fulfillment.groupby("customer_name")["total_sales"].sum().nlargest(5).reset_index()
-                fig = px.pie(top_customers, names="customer_name", values="total_sales", hole=0.3)
-                st.plotly_chart(fig, use_container_width=True)
-                st.markdown("""
-                **Sean Miller** leads customer sales contribution at **24.5%**, followed by **Peter Fuller** at **20.3%**, while **Tamara Chand**, **Seth Vernon**, and **Todd Sumrall** contribute between **18% and 18.7%**, showing a fairly balanced distribution among the top five.
-                """)
-
-            # Shipping Logistics
-            elif eda_section == "Shipping Logistics":
-                st.subheader("Shipping Logistics")
-                st.markdown("**Insights into shipping performance, average delivery times, and regional sales.**")
-                st.dataframe(df_shipping_logistics.head(10))
-
-                # Line Chart - Average Shipping Days Trend (Sampled Data)
-                st.subheader("Trend of Average Shipping Days Over Orders")
-                df_sampled_shipping = df_shipping_logistics.sample(n=100, random_state=42).sort_values("order_id", key=lambda x: x.astype(str))  # Reduce points plotted
-                fig = px.line(df_sampled_shipping, x="order_id", y="avg_shipping_days", markers=True)
-                st.plotly_chart(fig, use_container_width=True)
-                st.markdown("""
-                The average shipping days fluctuate significantly between **2 and 6 days** across orders, with no clear upward or downward trend, indicating inconsistent shipping times.
-                """)
-
-                # Bar Chart - Average Shipping Days by Ship Mode
-                st.subheader("Average Shipping Days by Ship Mode")
-                fig = px.bar(df_shipping_logistics, x="ship_mode", y="avg_shipping_days", text_auto=True)
-                st.plotly_chart(fig, use_container_width=True)
-                st.markdown("""
-                Longer average shipping times for "Standard Class" may indicate slower processing or higher volume, while "Same Day" shipping, despite its name, still averages 4 days, suggesting potential delays. Consistent averages for "First Class" and "Second Class" could reflect standardized processes or similar operational efficiencies.
-                """)
-
-                # Pie Chart - Sales Distribution by Region
-                st.subheader("Sales Distribution by Region")
-                fig = px.pie(df_shipping_logistics, names="region_name", values="total_sales", hole=0.3)
-                st.plotly_chart(fig, use_container_width=True)
-                st.markdown("""
-                The East region leads in sales contribution, followed closely by the West, while the Central and South regions account for smaller shares. The significant difference between East and South suggests varying market demand or performance across regions.
-                """)
+            # only the mart behind the selected subsection is built and fetched
+            mart_name = EDA_MARTS[eda_section]
+            with st.spinner(f"Fetching {mart_name}..."):
+                version = current_source_versions()[mart_name]
+                if sample_percent is None:
+                    df_mart = prefetcher.get(("mart", mart_name, version), partial(load_data_mart, mart_name))
+                else:
+                    df_mart = prefetcher.get(("mart_sample", mart_name, sample_percent, version), partial(fetch_sampled_data_mart, mart_name, sample_percent))
+            if df_mart is None:
+                st.error(f"Could not build or fetch {mart_name}, see etl_pipeline.log")
+            else:
+                st.success("Data Mart Fetched!")
+                render_sampling_notice(df_mart)
+
+                # Inventory Analysis
+                if eda_section == "Inventory Analysis":
+                    df_inventory = df_mart
+                    st.subheader("Inventory Analysis")
+                    st.markdown("**Overview of inventory sales and order distribution.**")
+                    st.dataframe(df_inventory.head(10))  # Show limited rows
+
+                    # Pie Chart - Sales Revenue by Category
+                    st.subheader("Sales Revenue Distribution by Category")
+                    fig = px.pie(df_inventory, names="Category", values="total_sales_revenue", hole=0.3)
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.markdown("""
+                    The Technology category accounts for 37.5% of the total sales revenue, making it the largest contributor. 
+                    Furniture follows closely with 31.8%, while Office Supplies contributes 30.6%, indicating a relatively 
+                    balanced revenue distribution across all three categories.
+                    """)
+
+                    # Bar Chart - Total Orders by Sub-Category
+                    st.subheader("Total Orders by Sub-Category")
+                    df_top_subcategories = df_inventory.groupby("Sub-Category")["total_orders"].sum().nlargest(10).reset_index()
+                    fig = px.bar(df_top_subcategories, x="Sub-Category", y="total_orders", text_auto=True)
+                    fig.update_layout(xaxis_tickangle=-45)
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.markdown("""
+                    **Binders** and **Paper** lead in total orders with **1,529** and **1,420** orders respectively, indicating high demand. **Furnishings** and **Phones** follow, while **Labels** and **Appliances** show the **lowest order volumes**, suggesting less customer interest in these sub-categories.
+                    """)
+
+                # Order Fulfillment
+                elif eda_section == "Order Fulfillment":
+                    df_order_fulfillment = df_mart
+                    st.subheader("Order Fulfillment")
+                    st.markdown("**Analysis of order fulfillment performance across different regions.**")
+                    st.dataframe(df_order_fulfillment.head(10))
+
+                    # Bar Chart - Total Sales by Region
+                    st.subheader("Total Sales by Region")
+                    fig = px.bar(df_order_fulfillment, 
+                                x="region_name", 
+                                y="total_sales") 
+                    st.plotly_chart(fig, use_container_width=True)
+
+                    st.markdown("""
+                    The **West** and **East** regions lead in total sales, with both nearing **800k**, while the **Central** region follows at around **500k**. The **South** region records the **lowest sales** at approximately **400k**, indicating a significant regional disparity.
+                    """)
+
+                    # Pie Chart - Top 5 Customers by Sales
+                    st.subheader("Top 5 Customers by Sales Contribution")
+                    top_customers = df_order_fulfillment.groupby("customer_name")["total_sales"].sum().nlargest(5).reset_index()
+                    fig = px.pie(top_customers, names="customer_name", values="total_sales", hole=0.3)
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.markdown("""
+                    **Sean Miller** leads customer sales contribution at **24.5%**, followed by **Peter Fuller** at **20.3%**, while **Tamara Chand**, **Seth Vernon**, and **Todd Sumrall** contribute between **18% and 18.7%**, showing a fairly balanced distribution among the top five.
+                    """)
+
+                # Shipping Logistics
+                elif eda_section == "Shipping Logistics":
+                    df_shipping_logistics = df_mart
+                    st.subheader("Shipping Logistics")
+                    st.markdown("**Insights into shipping performance, average delivery times, and regional sales.**")
+                    st.dataframe(df_shipping_logistics.head(10))
+
+                    # Line Chart - Average Shipping Days Trend (Sampled Data)
+                    st.subheader("Trend of Average Shipping Days Over Orders")
+                    df_sampled_shipping = df_shipping_logistics.sample(n=min(100, len(df_shipping_logistics)), random_state=42).sort_values("order_id", key=lambda x: x.astype(str))  # Reduce points plotted
+                    fig = px.line(df_sampled_shipping, x="order_id", y="avg_shipping_days", markers=True)
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.markdown("""
+                    The average shipping days fluctuate significantly between **2 and 6 days** across orders, with no clear upward or downward trend, indicating inconsistent shipping times.
+                    """)
+
+                    # Bar Chart - Average Shipping Days by Ship Mode
+                    st.subheader("Average Shipping Days by Ship Mode")
+                    fig = px.bar(df_shipping_logistics, x="ship_mode", y="avg_shipping_days", text_auto=True)
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.markdown("""
+                    Longer average shipping times for "Standard Class" may indicate slower processing or higher volume, while "Same Day" shipping, despite its name, still averages 4 days, suggesting potential delays. Consistent averages for "First Class" and "Second Class" could reflect standardized processes or similar operational efficiencies.
+                    """)
+
+                    # Pie Chart - Sales Distribution by Region
+                    st.subheader("Sales Distribution by Region")
+                    fig = px.pie(df_shipping_logistics, names="region_name", values="total_sales", hole=0.3)
+                    st.plotly_chart(fig, use_container_width=True)
+                    st.markdown("""
+                    The East region leads in sales contribution, followed closely by the West, while the Central and South regions account for smaller shares. The significant difference between East and South suggests varying market demand or performance across regions.
+                    """)
 
     elif section == 'Schema':
         st.subheader('Schema Overview')
@@ -273,87 +523,116 @@ def main():
         """)
 
     elif section == "Analysis":
-        analysis_subsection = st.sidebar.radio("Select Analysis Type", ["KPIs", "Aggregations"])
-        if st.button('Invoke Procedures & Generate Analysis Report'):
+        analysis_subsection = st.sidebar.radio("Select Analysis Type", ["KPIs", "Aggregations", "Explorer"])
+        # KPIs are usually followed by Aggregations, and Aggregations by the EDA marts
+        if analysis_subsection == "KPIs":
+            prefetcher.prefetch(aggregation_loaders(refresh=refresh_stale, source_versions=recent_source_versions()), requester=prefetch_requester())
+        elif analysis_subsection == "Aggregations":
+            prefetcher.prefetch(data_mart_loaders(EDA_MARTS.values(), recent_source_versions()), requester=prefetch_requester())
+        approx_orders = False
+        sample_percent = None
+        if analysis_subsection == "KPIs":
+            sample_percent = preview_controls()
+        if analysis_subsection == "Aggregations":
+            approx_orders = st.sidebar.checkbox("Approximate order counts (HLL sketches)")
+            if approx_orders:
+                relative_error = st.sidebar.select_slider("Relative error bound", options=[0.005, 0.01, 0.02, 0.05], value=DEFAULT_RELATIVE_ERROR)
+                start_date, end_date = date_range_controls(st.sidebar, "Order dates (empty for all)")
+        if analysis_subsection == "Explorer":
+            st.subheader("Sales Explorer")
+            st.markdown("**Slice and group sales interactively, answered from an in-memory cube.**")
+
+            # tables pre-processed in this session win over the warehouse copy
+            if "tables" in st.session_state:
+                if "sales_cube" not in st.session_state:
+                    st.session_state.sales_cube = SalesCube.from_tables(st.session_state.tables)
+                cube = st.session_state.sales_cube
+            else:
+                with st.spinner("Loading fact and dimension tables into the cube..."):
+                    cube = get_sales_cube()
+
+            filters = {}
+            filter_cols = st.columns(3)
+            for i, dimension in enumerate(CUBE_DIMENSIONS):
+                selected = filter_cols[i % 3].multiselect(dimension, sorted(cube.dictionaries[dimension]))
+                if selected:
+                    filters[dimension] = selected
+            group_by = st.multiselect("Group by", list(CUBE_DIMENSIONS), default=["Category"])
+
+            start = time.perf_counter()
+            df_slice = cube.query(filters, group_by)
+            st.caption(f"{len(df_slice)} group(s) over {cube.n_rows} fact rows in {(time.perf_counter() - start) * 1000:.1f} ms")
+            st.dataframe(df_slice)
+
+            if group_by:
+                fig = px.bar(df_slice, x=group_by[0], y="total_sales", color=group_by[1] if len(group_by) > 1 else None)
+                st.plotly_chart(fig, use_container_width=True)
+
+            with st.expander("Distinct orders by order date range (local HLL sketches)"):
+                tables = st.session_state.tables if "tables" in st.session_state else get_sales_tables()
+                sketch_cols = st.columns(3)
+                sketch_dimension = sketch_cols[0].selectbox("Count per", list(CUBE_DIMENSIONS))
+                sketch_error = sketch_cols[1].select_slider("Relative error bound", options=[0.02, 0.05], value=0.05)
+                sketch_start, sketch_end = date_range_controls(sketch_cols[2], "Order dates (empty for all)")
+
+                sketches, label = local_order_sketches(tables, sketch_dimension, sketch_error)
+                estimates = approx_distinct_orders(sketches, sketch_start, sketch_end, group_by=label)
+                df_estimates = pd.DataFrame(list(estimates.items()), columns=[sketch_dimension, "approx_orders"])
+                st.dataframe(df_estimates.sort_values("approx_orders", ascending=False, ignore_index=True))
+
+        elif st.button('Invoke Procedures & Generate Analysis Report'):
             if analysis_subsection == "KPIs":
                 st.subheader("Key Performance Indicators (KPIs)")
                 st.markdown("**Overview of important supply chain KPIs.**")
 
-                create_kpi_procedures()
-                kpi_results = execute_all_kpis()
-
-                for kpi_name, df_kpi in kpi_results.items():
-                    st.subheader(f"{kpi_name.replace('_', ' ').title()}")
-                    st.dataframe(df_kpi)
-
-                    # KPI Charts
-                    if "total_sales" in df_kpi.columns:
-                        fig = px.bar(df_kpi, x=df_kpi.columns[0], y="total_sales", text_auto=True)
-                        st.plotly_chart(fig, use_container_width=True)
-                        st.markdown("""
-                        Office Supplies dominate total sales by a significant margin compared to Technology and Furniture. The lower sales in Technology and Furniture could indicate either lower demand or higher price sensitivity in these categories.
-                        """)
-
-                    if "total_revenue" in df_kpi.columns:
-                        fig = px.pie(df_kpi, names=df_kpi.columns[0], values="total_revenue", hole=0.3)
-                        st.plotly_chart(fig, use_container_width=True)
-                        st.markdown("""
-                        Technology generates the most revenue, but Office Supplies and Furniture contribute nearly equal shares. Despite lower sales volume, Technology has a higher revenue share, indicating higher-priced items or better margins.
-                        """)
-
-                    if "avg_order_value" in df_kpi.columns:
-                        fig = px.bar(df_kpi, x=df_kpi.columns[0], y="avg_order_value", text_auto=True)
-                        st.plotly_chart(fig, use_container_width=True)
-                        st.markdown("""
-                        Technology leads with the highest average order value, followed by Furniture. Office Supplies has the lowest average order value, indicating smaller transaction sizes in that category.
-                        """)
-
-                    if "lead_time_days" in df_kpi.columns:
-                        fig = px.histogram(df_kpi, x="lead_time_days", nbins=20)
-                        st.plotly_chart(fig, use_container_width=True)
-                        st.markdown(
-                            """
-                            The distribution of lead times shows that most orders are fulfilled within 4 days, with a noticeable peak at this point. Lead times of 2 and 5 days are also common, while 0, 1, and 7 days are less frequent, suggesting variability in processing efficiency.
-                            """
-                        )
-
-                    if "avg_order_frequency" in df_kpi.columns:
-                        df_kpi["frequency_category"] = df_kpi["avg_order_frequency"].apply(
-                            lambda x: "1" if x == 1 else "1-2" if x <= 2 else "2-3" if x <= 3 else "3+"
-                        )
-                        freq_counts = df_kpi["frequency_category"].value_counts().reset_index()
-                        freq_counts.columns = ["Frequency Range", "Count"]
-
-                        fig = px.pie(freq_counts, names="Frequency Range", values="Count", hole=0.4)
-                        st.plotly_chart(fig, use_container_width=True)
-                        st.markdown("""
-                        The vast majority (97.9%) of customers placed only one order, while a small fraction (2.1%) placed between one and two orders. This suggests low repeat purchase behavior.
-                        """)
+                slots = [st.empty() for _ in KPI_PROCEDURES]
+                rendered = []
+                with st.spinner("Running KPI procedures..."):
+                    for (kpi_name, df_kpi), slot in zip(iter_all_kpis(refresh=refresh_stale, cache=prefetcher, sample_percent=sample_percent, source_versions=current_source_versions()), slots):
+                        with slot.container():
+                            render_kpi(kpi_name, df_kpi)
+                        rendered.append(kpi_name)
+                # the iterator skips procedures whose table could not be built or fetched
+                failed = [kpi_name for kpi_name in KPI_PROCEDURES if kpi_name not in rendered]
+                if failed:
+                    st.error(f"Could not build or fetch {', '.join(failed)}, see etl_pipeline.log")
+
+            elif analysis_subsection == "Aggregations" and approx_orders:
+                st.subheader("Approximate Order Counts")
+                st.markdown(f"**Distinct orders merged from per-day HLL sketches (±{relative_error:.1%}).**")
+
+                # sketches are rebuilt only when fact_sales / dim_orders or the chosen precision changed
+                refresh_stale(list(SKETCH_TABLES), settings={"@sketch_precision": precision_for_error(relative_error)})
+                slots = [st.empty() for _ in APPROX_ROLLUPS]
+                with st.spinner("Merging order sketches..."):
+                    for (rollup_name, df_rollup), slot in zip(iter_approx_rollups(start_date, end_date), slots):
+                        with slot.container():
+                            render_aggregation(rollup_name, df_rollup)
 
             elif analysis_subsection == "Aggregations":
                 st.subheader("Aggregated Metrics")
                 st.markdown("**Summarized insights from supply chain data.**")
 
-                create_aggregation_procedures()
-                agg_results = execute_all_aggregations()
-
-                for agg_name, df_agg in agg_results.items():
-                    st.subheader(f"{agg_name.replace('_', ' ').title()}")
-                    st.dataframe(df_agg)
-
-                    # Aggregation Charts
-                    if "total_sales" in df_agg.columns:
-                        fig = px.bar(df_agg, x=df_agg.columns[0], y="total_sales", text_auto=True)
-                        st.plotly_chart(fig, use_container_width=True)
-
-                    if "total_orders" in df_agg.columns:
-                        fig = px.bar(df_agg, x=df_agg.columns[0], y="total_orders", text_auto=True)
-                        st.plotly_chart(fig, use_container_width=True)
-
-                    if "total_revenue" in df_agg.columns:
-                        fig = px.pie(df_agg, names=df_agg.columns[0], values="total_revenue", hole=0.3)
-                        st.plotly_chart(fig, use_container_width=True)
-
+                # placeholders are filled in completion order, so the fastest procedure shows first
+                slots = [st.empty() for _ in AGGREGATION_PROCEDURES]
+                rendered = []
+                with st.spinner("Running aggregation procedures..."):
+                    for (agg_name, df_agg), slot in zip(iter_all_aggregations(refresh=refresh_stale, cache=prefetcher, source_versions=current_source_versions()), slots):
+                        with slot.container():
+                            render_aggregation(agg_name, df_agg)
+                        rendered.append(agg_name)
+                failed = [agg_name for agg_name in AGGREGATION_PROCEDURES if agg_name not in rendered]
+                if failed:
+                    st.error(f"Could not build or fetch {', '.join(failed)}, see etl_pipeline.log")
+
+    with st.sidebar.expander("Prefetch metrics"):
+        st.json(prefetcher.snapshot())
+    # identical warehouse jobs joined across sessions instead of re-submitted
+    with st.sidebar.expander("Coalesced queries"):
+        st.json(single_flight.snapshot())
+    if st.session_state.get("streaming_started"):
+        with st.sidebar.expander("Streaming ingest"):
+            st.json(get_streaming_ingest().snapshot())
 
 if __name__ == '__main__':
     main()
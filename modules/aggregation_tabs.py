@@ -1,7 +1,10 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from google.cloud import bigquery
 from dotenv import load_dotenv
+from modules.single_flight import run_query
 
 env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
 load_dotenv(env_path)
@@ -20,8 +23,16 @@ logging.basicConfig(
 )
 
 logger = logging.getLogger(__name__)
+
+AGGREGATION_PROCEDURES = {
+    "aggregate_sales_by_month": "agg_sales_monthly",
+    "aggregate_sales_by_product": "agg_sales_product",
+    "aggregate_sales_by_category": "agg_sales_category",
+    "aggregate_sales_by_subcategory": "agg_sales_subcategory",
+    "aggregate_revenue_by_region": "agg_revenue_region"
+}
     
-def create_aggregation_procedures():
+def create_aggregation_procedures(procedure_names=None):
     queries = {
         "aggregate_sales_by_month": f"""
         CREATE OR REPLACE PROCEDURE {DATASET_ID}.aggregate_sales_by_month()
@@ -109,8 +120,10 @@ def create_aggregation_procedures():
     }
 
     for procedure_name, query in queries.items():
+        if procedure_names is not None and procedure_name not in procedure_names:
+            continue
         try:
-            client.query(query).result()
+            run_query(client, query)
             logging.info(f"Created procedure: {procedure_name}")
         except Exception as e:
             logging.error(f"Error creating procedure '{procedure_name}': {e}")
@@ -120,10 +133,10 @@ def execute_aggregation_procedure(procedure_name, output_table):
     
     try:
         logger.info(f"Executing procedure: {procedure_name}...")
-        client.query(query).result()
+        run_query(client, query)
         logger.info(f"Successfully executed procedure: {procedure_name}. Fetching results...")
         
-        df = client.query(f"SELECT * FROM {DATASET_ID}.{output_table}").to_dataframe()
+        df = run_query(client, f"SELECT * FROM {DATASET_ID}.{output_table}", to_dataframe=True)
         logger.info(f"Successfully fetched data from {output_table}.")
         return df
     
@@ -131,20 +144,59 @@ def execute_aggregation_procedure(procedure_name, output_table):
         logger.error(f"Error executing procedure '{procedure_name}': {e}")
         return None
 
-def execute_all_aggregations():
-    aggregation_procedures = {
-        "aggregate_sales_by_month": "agg_sales_monthly",
-        "aggregate_sales_by_product": "agg_sales_product",
-        "aggregate_sales_by_category": "agg_sales_category",
-        "aggregate_sales_by_subcategory": "agg_sales_subcategory",
-        "aggregate_revenue_by_region": "agg_revenue_region"
-    }
+def call_aggregation_procedure(procedure_name):
+    create_aggregation_procedures([procedure_name])
+    query = f"CALL {DATASET_ID}.{procedure_name}();"
+
+    try:
+        logger.info(f"Executing procedure: {procedure_name}...")
+        run_query(client, query)
+        logger.info(f"Successfully executed procedure: {procedure_name}.")
+        return True
+
+    except Exception as e:
+        logger.error(f"Error executing procedure '{procedure_name}': {e}")
+        return False
 
-    results = {}
+def fetch_aggregation_table(output_table):
+    try:
+        df = run_query(client, f"SELECT * FROM {DATASET_ID}.{output_table}", to_dataframe=True)
+        logger.info(f"Successfully fetched data from {output_table}.")
+        return df
+
+    except Exception as e:
+        logger.error(f"Error fetching aggregation table '{output_table}': {e}")
+        return None
+
+def _create_and_execute(procedure_name, output_table, refresh=None):
+    if refresh is None:
+        create_aggregation_procedures([procedure_name])
+        return execute_aggregation_procedure(procedure_name, output_table)
+    # refresh only re-runs the procedure when its output is stale, then the table is read as-is
+    refresh([output_table])
+    return fetch_aggregation_table(output_table)
 
-    for procedure, output_table in aggregation_procedures.items():
-        df = execute_aggregation_procedure(procedure, output_table)
-        if df is not None:
-            results[procedure] = df
+def aggregation_loaders(refresh=None, source_versions=None):
+    # cache key -> zero-arg loader, lets a result cache or prefetcher run procedures on its own;
+    # source_versions (output table -> version of the data it reads) makes keys change when the data does
+    source_versions = source_versions or {}
+    return {
+        ("aggregation", procedure, source_versions.get(output_table)): partial(_create_and_execute, procedure, output_table, refresh)
+        for procedure, output_table in AGGREGATION_PROCEDURES.items()
+    }
 
-    return results
\ No newline at end of file
+def iter_all_aggregations(refresh=None, cache=None, source_versions=None, max_workers=len(AGGREGATION_PROCEDURES)):
+    # creates and calls every procedure concurrently, yielding (procedure, df) in completion order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            (executor.submit(cache.get, key, loader) if cache is not None else executor.submit(loader)): key[1]
+            for key, loader in aggregation_loaders(refresh, source_versions).items()
+        }
+        for future in as_completed(futures):
+            df = future.result()
+            if df is not None:
+                yield futures[future], df
+
+def execute_all_aggregations():
+    results = dict(iter_all_aggregations())
+    return {procedure: results[procedure] for procedure in AGGREGATION_PROCEDURES if procedure in results}
\ No newline at end of file
@@ -21,42 +21,176 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def partition_fact_sales():
-    query = f"""
-    CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET_ID}.fact_sales_partitioned`
-    PARTITION BY order_date AS
-    SELECT 
-        f.*, 
-        d.`Order Date` AS order_date
-    FROM `{PROJECT_ID}.{DATASET_ID}.fact_sales` f
-    LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_orders` d 
-    ON f.order_key = d.order_key;
+STAGED_TABLE = "fact_sales_staged"
+PARTITIONED_TABLE = "fact_sales_partitioned"
+CLUSTERED_TABLE = "fact_sales_partitioned_clustered"
+# fact rows appended by the streaming ingest, with their order_date and a batch_id, waiting to be staged
+STAGED_APPENDS_TABLE = "fact_sales_staged_appends"
+# every day staged ('appended') or a full restage ('rebuilt', order_date NULL), replayed by both layouts
+STAGE_LOG_TABLE = "fact_sales_stage_log"
+PARTITION_LOG_TABLE = "fact_sales_partition_log"
+
+def stage_fact_sales():
+    """
+    the fact -> dim_orders join both physical layouts need, done once and partitioned by order_date.
+    Rows waiting in the appends table are added as they are when they account for everything new in
+    fact_sales; after any other write the join is redone in full. Staged days go to the stage log
+    """
+    dataset = f"{PROJECT_ID}.{DATASET_ID}"
+    script = f"""
+    DECLARE batches ARRAY<STRING> DEFAULT [];
+    DECLARE appended_rows INT64 DEFAULT 0;
+    DECLARE staged_rows INT64 DEFAULT (SELECT row_count FROM `{dataset}.__TABLES__` WHERE table_id = '{STAGED_TABLE}');
+    DECLARE fact_rows INT64 DEFAULT (SELECT row_count FROM `{dataset}.__TABLES__` WHERE table_id = 'fact_sales');
+
+    CREATE TABLE IF NOT EXISTS `{dataset}.{STAGE_LOG_TABLE}` (order_date DATE, change_type STRING, staged_at TIMESTAMP);
+
+    IF EXISTS (SELECT 1 FROM `{dataset}.INFORMATION_SCHEMA.TABLES` WHERE table_name = '{STAGED_APPENDS_TABLE}') THEN
+        -- batches landing while this runs are left for the next run
+        SET batches = (SELECT IFNULL(ARRAY_AGG(DISTINCT batch_id), []) FROM `{dataset}.{STAGED_APPENDS_TABLE}`);
+        SET appended_rows = (SELECT COUNT(*) FROM `{dataset}.{STAGED_APPENDS_TABLE}` WHERE batch_id IN UNNEST(batches));
+    END IF;
+
+    IF ARRAY_LENGTH(batches) > 0
+        AND staged_rows + appended_rows = fact_rows
+        AND EXISTS (SELECT 1 FROM `{dataset}.INFORMATION_SCHEMA.COLUMNS`
+                    WHERE table_name = '{STAGED_TABLE}' AND column_name = 'order_date' AND is_partitioning_column = 'YES') THEN
+        BEGIN TRANSACTION;
+        INSERT INTO `{dataset}.{STAGED_TABLE}`
+        SELECT * EXCEPT (batch_id) FROM `{dataset}.{STAGED_APPENDS_TABLE}` WHERE batch_id IN UNNEST(batches);
+
+        INSERT INTO `{dataset}.{STAGE_LOG_TABLE}`
+        SELECT DISTINCT order_date, 'appended', CURRENT_TIMESTAMP()
+        FROM `{dataset}.{STAGED_APPENDS_TABLE}` WHERE batch_id IN UNNEST(batches);
+
+        DELETE FROM `{dataset}.{STAGED_APPENDS_TABLE}` WHERE batch_id IN UNNEST(batches);
+        COMMIT TRANSACTION;
+        SELECT 'appended' AS mode, appended_rows AS staged_rows;
+    ELSE
+        -- dropped rather than replaced, an older unpartitioned staged table cannot be replaced by a partitioned one
+        DROP TABLE IF EXISTS `{dataset}.{STAGED_TABLE}`;
+        CREATE TABLE `{dataset}.{STAGED_TABLE}`
+        PARTITION BY order_date AS
+        SELECT 
+            f.*, 
+            d.`Order Date` AS order_date
+        FROM `{dataset}.fact_sales` f
+        LEFT JOIN `{dataset}.dim_orders` d 
+        ON f.order_key = d.order_key;
+
+        INSERT INTO `{dataset}.{STAGE_LOG_TABLE}` VALUES (NULL, 'rebuilt', CURRENT_TIMESTAMP());
+        -- already part of fact_sales (or no longer matching it), either way the full join covered them
+        IF ARRAY_LENGTH(batches) > 0 THEN
+            DELETE FROM `{dataset}.{STAGED_APPENDS_TABLE}` WHERE batch_id IN UNNEST(batches);
+        END IF;
+        SELECT 'rebuilt' AS mode, (SELECT COUNT(*) FROM `{dataset}.{STAGED_TABLE}`) AS staged_rows;
+    END IF;
+    """
+    try:
+        df_mode = client.query(script).to_dataframe()
+        logging.info(f"Staged table '{STAGED_TABLE}' {df_mode['mode'].iloc[0]} ({df_mode['staged_rows'].iloc[0]} rows).")
+        return True
+    except Exception as e:
+        logging.error(f"Error staging fact_sales: {e}")
+        return False
+
+def _replay_stage_log(table_name, create_table, rows_filter, log_table=None):
+    """
+    script bringing a layout of the staged table up to date: re-created after a full restage (or when it
+    was never built), otherwise only the days staged since its last write are replaced. The day list is a
+    script variable, so the DELETE and the staged read prune to those partitions
+    """
+    dataset = f"{PROJECT_ID}.{DATASET_ID}"
+    create_log = (f"CREATE TABLE IF NOT EXISTS `{dataset}.{log_table}` (order_date DATE, change_type STRING, rewritten_at TIMESTAMP);"
+                  if log_table else "")
+    log_days = (f"""INSERT INTO `{dataset}.{log_table}`
+            SELECT order_date, 'appended', CURRENT_TIMESTAMP() FROM UNNEST(days) AS order_date;"""
+                if log_table else "")
+    log_rebuild = (f"INSERT INTO `{dataset}.{log_table}` VALUES (NULL, 'rebuilt', CURRENT_TIMESTAMP());"
+                   if log_table else "")
+    return f"""
+    DECLARE synced_at TIMESTAMP DEFAULT (
+        SELECT TIMESTAMP_MILLIS(last_modified_time) FROM `{dataset}.__TABLES__` WHERE table_id = '{table_name}');
+    DECLARE restaged_at TIMESTAMP DEFAULT (
+        SELECT MAX(staged_at) FROM `{dataset}.{STAGE_LOG_TABLE}` WHERE change_type = 'rebuilt');
+    DECLARE days ARRAY<DATE> DEFAULT [];
+    {create_log}
+
+    IF synced_at IS NULL OR restaged_at IS NULL OR restaged_at > synced_at THEN
+        {create_table}
+        {log_rebuild}
+        SELECT CAST(NULL AS DATE) AS order_date, 'rebuilt' AS change_type;
+    ELSE
+        SET days = (
+            SELECT IFNULL(ARRAY_AGG(DISTINCT order_date), []) FROM `{dataset}.{STAGE_LOG_TABLE}`
+            WHERE change_type = 'appended' AND staged_at > synced_at);
+        IF ARRAY_LENGTH(days) > 0 THEN
+            BEGIN TRANSACTION;
+            DELETE FROM `{dataset}.{table_name}` WHERE order_date IN UNNEST(days);
+            INSERT INTO `{dataset}.{table_name}`
+            SELECT * FROM `{dataset}.{STAGED_TABLE}` WHERE order_date IN UNNEST(days) {rows_filter};
+            {log_days}
+            COMMIT TRANSACTION;
+        END IF;
+        SELECT order_date, 'appended' AS change_type FROM UNNEST(days) AS order_date ORDER BY order_date;
+    END IF;
     """
+
+def partition_fact_sales():
+    dataset = f"{PROJECT_ID}.{DATASET_ID}"
+    create_table = f"""CREATE OR REPLACE TABLE `{dataset}.{PARTITIONED_TABLE}`
+        PARTITION BY order_date AS
+        SELECT * FROM `{dataset}.{STAGED_TABLE}`;"""
     try:
-        client.query(query).result()
-        logging.info("Partitioned table 'fact_sales_partitioned' created successfully.")
+        df_changed = client.query(_replay_stage_log(PARTITIONED_TABLE, create_table, "")).to_dataframe()
+        if (df_changed['change_type'] == 'rebuilt').any():
+            logging.info("Partitioned table 'fact_sales_partitioned' created successfully.")
+        else:
+            logging.info(f"Rewrote {len(df_changed)} partition(s) of 'fact_sales_partitioned'.")
+        return True
     except Exception as e:
         logging.error(f"Error partitioning fact_sales: {e}")
+        return False
+
+def _create_clustered_table():
+    dataset = f"{PROJECT_ID}.{DATASET_ID}"
+    # inner join semantics of the original clustered table: rows without an order date are left out
+    return f"""CREATE OR REPLACE TABLE `{dataset}.{CLUSTERED_TABLE}`
+        PARTITION BY order_date
+        CLUSTER BY customer_key, product_key, region_key
+        AS
+        SELECT * FROM `{dataset}.{STAGED_TABLE}`
+        WHERE order_date IS NOT NULL;"""
 
 def cluster_fact_sales():
-    query = f"""
-    CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET_ID}.fact_sales_partitioned_clustered`
-    PARTITION BY order_date
-    CLUSTER BY customer_key, product_key, region_key
-    AS
-    SELECT 
-      f.*, 
-      d.`Order Date` AS order_date
-    FROM `{PROJECT_ID}.{DATASET_ID}.fact_sales` f
-    JOIN `{PROJECT_ID}.{DATASET_ID}.dim_orders` d 
-    ON f.order_key = d.order_key;
-    """
     try:
-        client.query(query).result()
+        client.query(_create_clustered_table()).result()
         logging.info("Partitioned & clustered table 'fact_sales_partitioned_clustered' created successfully.")
+        return True
     except Exception as e:
         logging.error(f"Error clustering fact_sales: {e}")
+        return False
+
+def maintain_clustered_partitions():
+    """
+    rewrites only the order_date partitions of the clustered table that were staged since its last write
+    (all of it after a full restage), every rewritten day goes to the log table
+    """
+    script = _replay_stage_log(CLUSTERED_TABLE, _create_clustered_table(), "AND order_date IS NOT NULL", log_table=PARTITION_LOG_TABLE)
+    try:
+        df_changed = client.query(script).to_dataframe()
+        if (df_changed['change_type'] == 'rebuilt').any():
+            logging.info(f"Rebuilt '{CLUSTERED_TABLE}' after a full restage.")
+        else:
+            logging.info(f"Rewrote {len(df_changed)} partition(s) of '{CLUSTERED_TABLE}'.")
+        return df_changed
+    except Exception as e:
+        logging.error(f"Error maintaining partitions of '{CLUSTERED_TABLE}': {e}")
+        return None
 
-def execute_partitioning_and_clustering():
+def execute_partitioning_and_clustering(incremental=False):
+    stage_fact_sales()
+    if incremental:
+        return maintain_clustered_partitions()
     partition_fact_sales()
-    cluster_fact_sales()
\ No newline at end of file
+    cluster_fact_sales()
@@ -1,6 +1,7 @@
 import os
 import kaggle
 import logging
+import numpy as np
 import pandas as pd
 
 log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
@@ -22,12 +23,37 @@ def fetch_kaggle_data(dataset, download_path = './data'):
     except Exception as e:
         logger.error(f'failed to fetch dataset {dataset}: {e}')
 
+def read_csv_preview(file_path, n_rows=5, sample=False, chunksize=50_000):
+    """
+    first n_rows of the csv without loading the rest, or with sample=True a uniform sample of
+    n_rows drawn while streaming the file in chunks (reservoir-style, keyed by a random draw per row)
+    """
+    if not sample:
+        return pd.read_csv(file_path, nrows=n_rows)
+
+    rng = np.random.default_rng()
+    kept = None
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        chunk = chunk.assign(_draw=rng.random(len(chunk)))
+        kept = chunk if kept is None else pd.concat([kept, chunk])
+        kept = kept.nsmallest(n_rows, '_draw')
+    if kept is None:
+        return pd.read_csv(file_path, nrows=0)
+    return kept.sort_index().drop(columns='_draw')
+
 def preprocess_data(file_path):
     try:
         logger.info(f"Loading dataset from {file_path}")
         df = pd.read_csv(file_path)
+    except Exception as e:
+        logger.error(f"Data preprocessing failed: {e}")
+        return None
+    return preprocess_records(df)
 
-        if 'Postal Code' in df.columns:
+def preprocess_records(df):
+    # the cleaning steps of preprocess_data for rows already in memory, e.g. a streamed micro-batch
+    try:
+        if 'Postal Code' in df.columns and df['Postal Code'].notna().any():
             df.fillna({'Postal Code': df['Postal Code'].mode()[0]}, inplace=True)
 
         df_before = df.shape[0]
@@ -58,6 +84,8 @@ def create_fact_and_dimensions(df: pd.DataFrame):
 
         df['Order Date'] = pd.to_datetime(df['Order Date']).dt.date
         df['Ship Date'] = pd.to_datetime(df['Ship Date']).dt.date
+        # FLOAT whether or not this load had missing postal codes, so appended batches match the table
+        df['Postal Code'] = df['Postal Code'].astype(float)
 
         df_orders = df[['Order ID', 'Order Date']].drop_duplicates()
         df_shipping = df[['Ship Date', 'Ship Mode']].drop_duplicates()
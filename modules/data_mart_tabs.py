@@ -2,6 +2,8 @@ import logging
 import os
 from google.cloud import bigquery
 from dotenv import load_dotenv
+from modules.sampling import SAMPLED_FACT_TABLE, run_sampled_query
+from modules.single_flight import run_query
 
 env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
 load_dotenv(env_path)
@@ -21,9 +23,12 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def create_data_marts():
-    queries = {
-        "mart_inventory_analysis": f"""CREATE OR REPLACE TABLE {PROJECT_ID}.{DATASET_ID}.mart_inventory_analysis AS
+def _data_mart_queries(fact_sales=None):
+    # mart SELECTs, fact_sales can be swapped for a sampled copy
+    fact_sales = fact_sales or f"`{PROJECT_ID}.{DATASET_ID}.fact_sales`"
+
+    return {
+        "mart_inventory_analysis": f"""
         SELECT  
             p.product_key,  
             p.`Product Name`,  
@@ -31,14 +36,13 @@ def create_data_marts():
             p.`Sub-Category`,  
             COUNT(DISTINCT f.order_key) AS total_orders,  
             SUM(f.Sales) AS total_sales_revenue  
-        FROM {PROJECT_ID}.{DATASET_ID}.fact_sales f  
+        FROM {fact_sales} f
         JOIN {PROJECT_ID}.{DATASET_ID}.dim_products p  
             ON f.product_key = p.product_key  
         GROUP BY  
-            p.product_key, p.`Product Name`, p.`Category`, p.`Sub-Category`;""",
+            p.product_key, p.`Product Name`, p.`Category`, p.`Sub-Category`""",
 
-        "mart_order_fulfillment": f"""CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET_ID}.mart_order_fulfillment`
-        AS
+        "mart_order_fulfillment": f"""
         SELECT 
             f.order_key,
             d.`Order ID` AS order_id,
@@ -48,7 +52,7 @@ def create_data_marts():
             r.`Region` AS region_name,  
             SUM(f.Sales) AS total_sales,
             COUNT(f.order_key) AS total_orders
-        FROM `{PROJECT_ID}.{DATASET_ID}.fact_sales` f
+        FROM {fact_sales} f
         LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_orders` d 
             ON f.order_key = d.order_key
         LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_customers` c 
@@ -57,9 +61,9 @@ def create_data_marts():
             ON f.product_key = p.product_key
         LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_regions` r 
             ON f.region_key = r.region_key  
-        GROUP BY f.order_key, order_id, customer_id, customer_name, product_name, region_name;""",
+        GROUP BY f.order_key, order_id, customer_id, customer_name, product_name, region_name""",
 
-        "mart_shipping_logistics": f"""CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET_ID}.mart_shipping_logistics` AS
+        "mart_shipping_logistics": f"""
         SELECT 
             f.order_key,
             d.`Order ID` AS order_id,
@@ -70,7 +74,7 @@ def create_data_marts():
             SUM(f.Sales) AS total_sales,
             COUNT(f.order_key) AS total_orders,
             CAST(AVG(DATE_DIFF(s.`Ship Date`, d.`Order Date`, DAY)) AS INT) AS avg_shipping_days
-        FROM `{PROJECT_ID}.{DATASET_ID}.fact_sales` f
+        FROM {fact_sales} f
         LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_orders` d 
             ON f.order_key = d.order_key
         LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_customers` c 
@@ -79,22 +83,57 @@ def create_data_marts():
             ON f.region_key = r.region_key
         LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_shipping` s 
             ON f.ship_key = s.ship_key
-        GROUP BY f.order_key, order_id, customer_id, customer_name, region_name, ship_mode;"""
+        GROUP BY f.order_key, order_id, customer_id, customer_name, region_name, ship_mode"""
+    }
+
+# mart -> (columns that may be scaled up from a sample, key whole rows are sampled by);
+# per-order marts sample whole orders and are not scaled, distinct counts never are
+SAMPLED_MARTS = {
+    "mart_inventory_analysis": (["total_sales_revenue"], None),
+    "mart_order_fulfillment": ([], "order_key"),
+    "mart_shipping_logistics": ([], "order_key")
+}
+
+def create_data_marts(mart_names=None):
+    queries = {
+        mart_name: f"CREATE OR REPLACE TABLE `{PROJECT_ID}.{DATASET_ID}.{mart_name}` AS {select};"
+        for mart_name, select in _data_mart_queries().items()
     }
 
+    created = []
     for mart_name, query in queries.items():
+        if mart_names is not None and mart_name not in mart_names:
+            continue
         try:
-            client.query(query).result()
+            run_query(client, query)
             logger.info(f"Data mart '{mart_name}' created successfully.")
+            created.append(mart_name)
         except Exception as e:
             logger.error(f"Error creating data mart '{mart_name}': {e}")
 
+    return created
+
 def fetch_data_mart(mart_name):
     try:
         query = f"SELECT * FROM `{PROJECT_ID}.{DATASET_ID}.{mart_name}`"
-        df = client.query(query).to_dataframe()
+        df = run_query(client, query, to_dataframe=True)
         logger.info(f"Fetched data mart: {mart_name}")
         return df
     except Exception as e:
         logger.error(f"Error fetching data mart '{mart_name}': {e}")
-        return None
\ No newline at end of file
+        return None
+
+def fetch_sampled_data_mart(mart_name, sample_percent):
+    """
+    runs the mart SELECT over a sample of fact_sales without touching the mart table,
+    sampled as SAMPLED_MARTS says
+    """
+    try:
+        select = _data_mart_queries(SAMPLED_FACT_TABLE)[mart_name]
+        scaled_columns, sample_by = SAMPLED_MARTS[mart_name]
+        df = run_sampled_query(client, select, sample_percent, scaled_columns, sample_by)
+        logger.info(f"Fetched {sample_percent}% sample of data mart: {mart_name}")
+        return df
+    except Exception as e:
+        logger.error(f"Error fetching sampled data mart '{mart_name}': {e}")
+        return None
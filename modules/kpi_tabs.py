@@ -1,7 +1,11 @@
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from google.cloud import bigquery
 from dotenv import load_dotenv
+from modules.sampling import SAMPLED_FACT_TABLE, run_sampled_query
+from modules.single_flight import run_query
 
 env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
 load_dotenv(env_path)
@@ -21,77 +25,95 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def create_kpi_procedures():
-    queries = {
-        "calculate_lead_time": f"""CREATE OR REPLACE PROCEDURE {DATASET_ID}.calculate_lead_time()
-        BEGIN
-            CREATE OR REPLACE TABLE {DATASET_ID}.kpi_lead_time AS
+KPI_PROCEDURES = {
+    "calculate_lead_time": "kpi_lead_time",
+    "product_category_performance": "kpi_product_category_performance",
+    "product_subcategory_performance": "kpi_product_subcategory_performance",
+    "avg_order_value_per_category": "kpi_avg_order_value_per_category",
+    "avg_order_frequency_by_customer": "kpi_avg_order_frequency_by_customer"
+}
+
+def _kpi_queries(fact_sales=None):
+    # KPI SELECTs, fact_sales can be swapped for a sampled copy
+    fact_sales = fact_sales or f"{DATASET_ID}.fact_sales"
+
+    return {
+        "calculate_lead_time": f"""
             SELECT 
                 f.order_key, 
                 d.`Order ID`, 
                 p.`Product ID`,
                 DATE_DIFF(MAX(s.`Ship Date`), MIN(d.`Order Date`), DAY) AS lead_time_days
-            FROM {DATASET_ID}.fact_sales f    
+            FROM {fact_sales} f
             LEFT JOIN {DATASET_ID}.dim_orders d ON f.order_key = d.order_key
             LEFT JOIN {DATASET_ID}.dim_shipping s ON f.ship_key = s.ship_key
             LEFT JOIN {DATASET_ID}.dim_products p ON f.product_key = p.product_key
-            GROUP BY f.order_key, d.`Order ID`, p.`Product ID`;
-        END;""",
+            GROUP BY f.order_key, d.`Order ID`, p.`Product ID`""",
         
-        "product_category_performance": f"""CREATE OR REPLACE PROCEDURE {DATASET_ID}.product_category_performance()
-        BEGIN
-            CREATE OR REPLACE TABLE {DATASET_ID}.kpi_product_category_performance AS
+        "product_category_performance": f"""
             SELECT 
                 p.Category, 
                 COUNT(f.product_key) AS total_sales,
                 SUM(f.Sales) AS total_revenue,
                 AVG(f.Sales) AS avg_revenue_per_sale
-            FROM {DATASET_ID}.fact_sales f
+            FROM {fact_sales} f
             LEFT JOIN {DATASET_ID}.dim_products p ON f.product_key = p.product_key
-            GROUP BY p.Category;
-        END;""",
+            GROUP BY p.Category""",
         
-        "product_subcategory_performance": f"""CREATE OR REPLACE PROCEDURE {DATASET_ID}.product_subcategory_performance()
-        BEGIN
-            CREATE OR REPLACE TABLE {DATASET_ID}.kpi_product_subcategory_performance AS
+        "product_subcategory_performance": f"""
             SELECT 
                 p.Category, 
                 p.`Sub-Category`, 
                 COUNT(f.product_key) AS total_sales,
                 SUM(f.Sales) AS total_revenue,
                 AVG(f.Sales) AS avg_revenue_per_sale
-            FROM {DATASET_ID}.fact_sales f
+            FROM {fact_sales} f
             LEFT JOIN {DATASET_ID}.dim_products p ON f.product_key = p.product_key
-            GROUP BY p.Category, p.`Sub-Category`;
-        END;""",
+            GROUP BY p.Category, p.`Sub-Category`""",
         
-        "avg_order_value_per_category": f"""CREATE OR REPLACE PROCEDURE {DATASET_ID}.avg_order_value_per_category()
-        BEGIN
-            CREATE OR REPLACE TABLE {DATASET_ID}.kpi_avg_order_value_per_category AS
+        "avg_order_value_per_category": f"""
             SELECT 
                 p.Category,
                 AVG(f.Sales) AS avg_order_value
-            FROM {DATASET_ID}.fact_sales f
+            FROM {fact_sales} f
             LEFT JOIN {DATASET_ID}.dim_products p ON f.product_key = p.product_key
-            GROUP BY p.Category;
-        END;""",
+            GROUP BY p.Category""",
         
-        "avg_order_frequency_by_customer": f"""CREATE OR REPLACE PROCEDURE {DATASET_ID}.avg_order_frequency_by_customer()
-        BEGIN
-            CREATE OR REPLACE TABLE {DATASET_ID}.kpi_avg_order_frequency_by_customer AS
+        "avg_order_frequency_by_customer": f"""
             SELECT 
                 c.`Customer Name`,
                 COUNT(DISTINCT f.order_key) / COUNT(DISTINCT d.`Order Date`) AS avg_order_frequency
-            FROM {DATASET_ID}.fact_sales f
+            FROM {fact_sales} f
             LEFT JOIN {DATASET_ID}.dim_orders d ON f.order_key = d.order_key
             LEFT JOIN {DATASET_ID}.dim_customers c ON f.customer_key = c.customer_key
-            GROUP BY c.`Customer Name`;
+            GROUP BY c.`Customer Name`"""
+    }
+
+# procedure -> (columns that may be scaled up from a sample, key whole rows are sampled by)
+SAMPLED_KPIS = {
+    "calculate_lead_time": ([], "order_key"),
+    "product_category_performance": (["total_sales", "total_revenue"], None),
+    "product_subcategory_performance": (["total_sales", "total_revenue"], None),
+    "avg_order_value_per_category": ([], None),
+    # a ratio of distinct counts, whole orders keep each order's dates together
+    "avg_order_frequency_by_customer": ([], "order_key")
+}
+
+def create_kpi_procedures(procedure_names=None):
+    queries = {
+        proc_name: f"""CREATE OR REPLACE PROCEDURE {DATASET_ID}.{proc_name}()
+        BEGIN
+            CREATE OR REPLACE TABLE {DATASET_ID}.{KPI_PROCEDURES[proc_name]} AS
+            {select};
         END;"""
+        for proc_name, select in _kpi_queries().items()
     }
     
     for proc_name, query in queries.items():
+        if procedure_names is not None and proc_name not in procedure_names:
+            continue
         try:
-            client.query(query).result()
+            run_query(client, query)
             logging.info(f"Procedure '{proc_name}' created successfully.")
         except Exception as e:
             logging.error(f"Error creating procedure '{proc_name}': {e}")
@@ -101,10 +123,10 @@ def execute_kpi_procedure(procedure_name, output_table):
     
     try:
         logger.info(f"Executing procedure: {procedure_name}...")
-        client.query(query).result()
+        run_query(client, query)
         logger.info(f"Successfully executed procedure: {procedure_name}. Fetching results...")
         
-        df = client.query(f"SELECT * FROM {DATASET_ID}.{output_table}").to_dataframe()
+        df = run_query(client, f"SELECT * FROM {DATASET_ID}.{output_table}", to_dataframe=True)
         logger.info(f"Successfully fetched data from {output_table}.")
         return df
     
@@ -112,20 +134,77 @@ def execute_kpi_procedure(procedure_name, output_table):
         logger.error(f"Error executing procedure '{procedure_name}': {e}")
         return None
 
-def execute_all_kpis():
-    kpi_procedures = {
-        "calculate_lead_time": "kpi_lead_time",
-        "product_category_performance": "kpi_product_category_performance",
-        "product_subcategory_performance": "kpi_product_subcategory_performance",
-        "avg_order_value_per_category": "kpi_avg_order_value_per_category",
-        "avg_order_frequency_by_customer": "kpi_avg_order_frequency_by_customer"
-    }
+def call_kpi_procedure(procedure_name):
+    create_kpi_procedures([procedure_name])
+    query = f"CALL {DATASET_ID}.{procedure_name}();"
+
+    try:
+        logger.info(f"Executing procedure: {procedure_name}...")
+        run_query(client, query)
+        logger.info(f"Successfully executed procedure: {procedure_name}.")
+        return True
 
-    results = {}
+    except Exception as e:
+        logger.error(f"Error executing procedure '{procedure_name}': {e}")
+        return False
+
+def fetch_kpi_table(output_table):
+    try:
+        df = run_query(client, f"SELECT * FROM {DATASET_ID}.{output_table}", to_dataframe=True)
+        logger.info(f"Successfully fetched data from {output_table}.")
+        return df
 
-    for procedure, output_table in kpi_procedures.items():
-        df = execute_kpi_procedure(procedure, output_table)
-        if df is not None:
-            results[procedure] = df
+    except Exception as e:
+        logger.error(f"Error fetching KPI table '{output_table}': {e}")
+        return None
 
-    return results
\ No newline at end of file
+def fetch_sampled_kpi(procedure_name, sample_percent):
+    # the KPI SELECT over a sample of fact_sales (as SAMPLED_KPIS says), nothing is written to the KPI table
+    try:
+        select = _kpi_queries(SAMPLED_FACT_TABLE)[procedure_name]
+        scaled_columns, sample_by = SAMPLED_KPIS[procedure_name]
+        df = run_sampled_query(client, select, sample_percent, scaled_columns, sample_by)
+        logger.info(f"Fetched {sample_percent}% sample of KPI: {procedure_name}")
+        return df
+
+    except Exception as e:
+        logger.error(f"Error fetching sampled KPI '{procedure_name}': {e}")
+        return None
+
+def _create_and_execute(procedure_name, output_table, refresh=None):
+    if refresh is None:
+        create_kpi_procedures([procedure_name])
+        return execute_kpi_procedure(procedure_name, output_table)
+    # refresh only re-runs the procedure when its output is stale, then the table is read as-is
+    refresh([output_table])
+    return fetch_kpi_table(output_table)
+
+def kpi_loaders(refresh=None, sample_percent=None, source_versions=None):
+    # cache key -> zero-arg loader, lets a result cache or prefetcher run procedures on its own;
+    # source_versions (output table -> version of the data it reads) makes keys change when the data does
+    source_versions = source_versions or {}
+    if sample_percent is not None:
+        return {
+            ("kpi_sample", procedure, sample_percent, source_versions.get(output_table)): partial(fetch_sampled_kpi, procedure, sample_percent)
+            for procedure, output_table in KPI_PROCEDURES.items()
+        }
+    return {
+        ("kpi", procedure, source_versions.get(output_table)): partial(_create_and_execute, procedure, output_table, refresh)
+        for procedure, output_table in KPI_PROCEDURES.items()
+    }
+
+def iter_all_kpis(refresh=None, cache=None, sample_percent=None, source_versions=None, max_workers=len(KPI_PROCEDURES)):
+    # creates and calls every procedure concurrently, yielding (procedure, df) in completion order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            (executor.submit(cache.get, key, loader) if cache is not None else executor.submit(loader)): key[1]
+            for key, loader in kpi_loaders(refresh, sample_percent, source_versions).items()
+        }
+        for future in as_completed(futures):
+            df = future.result()
+            if df is not None:
+                yield futures[future], df
+
+def execute_all_kpis():
+    results = dict(iter_all_kpis())
+    return {procedure: results[procedure] for procedure in KPI_PROCEDURES if procedure in results}
\ No newline at end of file
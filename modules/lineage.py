@@ -0,0 +1,227 @@
+import logging
+import os
+import threading
+from graphlib import TopologicalSorter
+from google.cloud import bigquery
+from dotenv import load_dotenv
+from modules.aggregation_tabs import AGGREGATION_PROCEDURES, call_aggregation_procedure
+from modules.clustering_and_partitioning import (CLUSTERED_TABLE, PARTITIONED_TABLE, STAGED_TABLE,
+                                                 maintain_clustered_partitions, partition_fact_sales,
+                                                 stage_fact_sales)
+from modules.data_mart_tabs import create_data_marts
+from modules.kpi_tabs import KPI_PROCEDURES, call_kpi_procedure
+from modules.order_sketches import DEFAULT_RELATIVE_ERROR, SKETCH_TABLES, create_order_sketches, precision_for_error
+
+env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
+load_dotenv(env_path)
+
+PROJECT_ID = os.getenv('PROJECT_ID')
+DATASET_ID = os.getenv('DATASET_ID')
+
+client = bigquery.Client()
+
+log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
+
+logging.basicConfig(
+    filename=log_file_path,
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+BUILD_LOG_TABLE = "lineage_builds"
+
+# build setting -> default value; a setting is listed in LINEAGE like an upstream table and its value is
+# recorded as that upstream's version, so a table built with another value is stale
+BUILD_SETTINGS = {
+    "@sketch_precision": precision_for_error(DEFAULT_RELATIVE_ERROR)
+}
+
+# derived table -> tables its SQL reads
+LINEAGE = {
+    "mart_inventory_analysis": ["fact_sales", "dim_products"],
+    "mart_order_fulfillment": ["fact_sales", "dim_orders", "dim_customers", "dim_products", "dim_regions"],
+    "mart_shipping_logistics": ["fact_sales", "dim_orders", "dim_customers", "dim_regions", "dim_shipping"],
+
+    "kpi_lead_time": ["fact_sales", "dim_orders", "dim_shipping", "dim_products"],
+    "kpi_product_category_performance": ["fact_sales", "dim_products"],
+    "kpi_product_subcategory_performance": ["fact_sales", "dim_products"],
+    "kpi_avg_order_value_per_category": ["fact_sales", "dim_products"],
+    "kpi_avg_order_frequency_by_customer": ["fact_sales", "dim_orders", "dim_customers"],
+
+    "agg_sales_monthly": ["fact_sales", "dim_orders"],
+    "agg_sales_product": ["fact_sales", "dim_products"],
+    "agg_sales_category": ["fact_sales", "dim_products"],
+    "agg_sales_subcategory": ["fact_sales", "dim_products"],
+    "agg_revenue_region": ["fact_sales", "dim_regions"],
+
+    STAGED_TABLE: ["fact_sales", "dim_orders"],
+    PARTITIONED_TABLE: [STAGED_TABLE],
+    CLUSTERED_TABLE: [STAGED_TABLE],
+
+    # sketches re-read only the days the partition maintenance rewrote
+    **{table_name: [CLUSTERED_TABLE, "@sketch_precision"] for table_name in SKETCH_TABLES}
+}
+
+# derived table -> callable rebuilding it, returns truthy on success; settings in its LINEAGE entry
+# are passed as keyword arguments (without the @)
+BUILDERS = {
+    **{mart_name: (lambda mart_name=mart_name: mart_name in create_data_marts([mart_name]))
+       for mart_name in ["mart_inventory_analysis", "mart_order_fulfillment", "mart_shipping_logistics"]},
+    **{output_table: (lambda procedure=procedure: call_kpi_procedure(procedure))
+       for procedure, output_table in KPI_PROCEDURES.items()},
+    **{output_table: (lambda procedure=procedure: call_aggregation_procedure(procedure))
+       for procedure, output_table in AGGREGATION_PROCEDURES.items()},
+    STAGED_TABLE: stage_fact_sales,
+    PARTITIONED_TABLE: partition_fact_sales,
+    CLUSTERED_TABLE: lambda: maintain_clustered_partitions() is not None,
+    **{table_name: (lambda sketch_precision, table_name=table_name:
+                    table_name in create_order_sketches(table_names=[table_name], precision=sketch_precision))
+       for table_name in SKETCH_TABLES}
+}
+
+_build_log_ready = threading.Event()
+
+def _ensure_build_log():
+    if _build_log_ready.is_set():
+        return
+    query = f"""CREATE TABLE IF NOT EXISTS `{PROJECT_ID}.{DATASET_ID}.{BUILD_LOG_TABLE}` (
+        derived_table STRING,
+        upstream_table STRING,
+        upstream_version INT64,
+        built_at TIMESTAMP
+    );"""
+    client.query(query).result()
+    _build_log_ready.set()
+
+def fetch_table_versions():
+    # last_modified_time (ms since epoch) of every table in the dataset, one metadata lookup
+    query = f"SELECT table_id, last_modified_time FROM `{PROJECT_ID}.{DATASET_ID}.__TABLES__`"
+    df = client.query(query).to_dataframe()
+    return dict(zip(df['table_id'], df['last_modified_time']))
+
+def fetch_recorded_builds():
+    # upstream versions each derived table was last built from
+    query = f"""SELECT derived_table, upstream_table, upstream_version
+    FROM `{PROJECT_ID}.{DATASET_ID}.{BUILD_LOG_TABLE}`
+    WHERE TRUE
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY derived_table, upstream_table ORDER BY built_at DESC) = 1"""
+    df = client.query(query).to_dataframe()
+    builds = {}
+    for derived_table, upstream_table, upstream_version in df.itertuples(index=False):
+        builds.setdefault(derived_table, {})[upstream_table] = upstream_version
+    return builds
+
+def source_versions(tables, versions=None):
+    """
+    table -> newest last_modified_time of the non-derived tables it reads (directly or through derived
+    tables); a result cached under it stops matching as soon as new data lands in any of them
+    """
+    versions = fetch_table_versions() if versions is None else versions
+    result = {}
+    for table in tables:
+        sources, pending = set(), list(LINEAGE.get(table, []))
+        while pending:
+            upstream = pending.pop()
+            if upstream in LINEAGE:
+                pending.extend(LINEAGE[upstream])
+            elif upstream not in BUILD_SETTINGS:
+                sources.add(upstream)
+        result[table] = max((int(versions.get(source, 0)) for source in sources), default=0)
+    return result
+
+def _record_build(derived_table, upstream_versions):
+    # append-only, concurrent sessions recording builds never conflict on DML
+    rows = ", ".join(
+        f"('{derived_table}', '{upstream_table}', {int(version)}, CURRENT_TIMESTAMP())"
+        for upstream_table, version in upstream_versions.items()
+    )
+    query = f"INSERT INTO `{PROJECT_ID}.{DATASET_ID}.{BUILD_LOG_TABLE}` VALUES {rows}"
+    client.query(query).result()
+
+def _with_derived_ancestors(tables):
+    needed = set()
+    pending = list(tables)
+    while pending:
+        table = pending.pop()
+        if table in needed or table not in LINEAGE:
+            continue
+        needed.add(table)
+        pending.extend(LINEAGE[table])
+    return needed
+
+def _build_order(tables):
+    graph = {table: [upstream for upstream in LINEAGE[table] if upstream in tables] for table in tables}
+    return list(TopologicalSorter(graph).static_order())
+
+def _compared(table, versions):
+    # settings not pinned in versions accept whatever value the table was last built with
+    return [upstream for upstream in LINEAGE[table] if upstream in versions or upstream not in BUILD_SETTINGS]
+
+def find_stale(targets=None, versions=None, builds=None):
+    """
+    derived tables (targets and the derived tables they read) that are missing, were built from an
+    older version of one of their upstream tables, or read a derived table that is itself stale
+    """
+    _ensure_build_log()
+    versions = fetch_table_versions() if versions is None else versions
+    builds = fetch_recorded_builds() if builds is None else builds
+
+    stale = []
+    for table in _build_order(_with_derived_ancestors(targets or LINEAGE)):
+        recorded = builds.get(table, {})
+        if (table not in versions
+                or any(upstream in stale for upstream in LINEAGE[table])
+                or any(recorded.get(upstream) != versions.get(upstream) for upstream in _compared(table, versions))):
+            stale.append(table)
+    return stale
+
+def refresh_stale(targets=None, settings=None):
+    """
+    rebuilds only the stale derived tables needed for targets (all derived tables by default),
+    upstream first, and returns the rebuilt table names; when everything is fresh this is two metadata queries.
+    settings pins build settings (e.g. {"@sketch_precision": 14}), unpinned ones keep the value last built with
+    """
+    settings = settings or {}
+    try:
+        # before fetch_recorded_builds, which fails on a dataset that has no build log yet
+        _ensure_build_log()
+        versions = {**fetch_table_versions(), **settings}
+        builds = fetch_recorded_builds()
+        stale = find_stale(targets, versions=versions, builds=builds)
+    except Exception as e:
+        logger.error(f"Error checking freshness of {targets or 'all derived tables'}: {e}")
+        return []
+
+    rebuilt = []
+    for table in stale:
+        missing = [upstream for upstream in LINEAGE[table] if upstream not in versions and upstream not in BUILD_SETTINGS]
+        if missing:
+            logger.error(f"Cannot rebuild '{table}', upstream table(s) {missing} do not exist")
+            continue
+        if any(upstream in stale and upstream not in rebuilt for upstream in LINEAGE[table]):
+            logger.error(f"Cannot rebuild '{table}', a stale upstream table failed to rebuild")
+            continue
+
+        recorded = builds.get(table, {})
+        upstream_versions = {
+            upstream: versions[upstream] if upstream in versions else recorded.get(upstream, BUILD_SETTINGS[upstream])
+            for upstream in LINEAGE[table]
+        }
+        build_settings = {upstream[1:]: value for upstream, value in upstream_versions.items() if upstream in BUILD_SETTINGS}
+        if not BUILDERS[table](**build_settings):
+            logger.error(f"Rebuilding stale table '{table}' failed")
+            continue
+
+        try:
+            _record_build(table, upstream_versions)
+            versions = {**fetch_table_versions(), **settings}
+        except Exception as e:
+            logger.error(f"Error recording build of '{table}': {e}")
+        rebuilt.append(table)
+        logger.info(f"Rebuilt stale table '{table}'")
+
+    if not stale:
+        logger.info(f"All of {targets or 'the derived tables'} are fresh")
+    return rebuilt
@@ -0,0 +1,237 @@
+import logging
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
+
+logging.basicConfig(
+    filename=log_file_path,
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+# cube dimension -> (dim table, fact key, dim column)
+CUBE_DIMENSIONS = {
+    "Category": ("dim_products", "product_key", "Category"),
+    "Sub-Category": ("dim_products", "product_key", "Sub-Category"),
+    "Region": ("dim_regions", "region_key", "Region"),
+    "Segment": ("dim_customers", "customer_key", "Segment"),
+    "Ship Mode": ("dim_shipping", "ship_key", "Ship Mode"),
+    "Order Month": ("dim_orders", "order_key", "Order Date")
+}
+
+# roaring layout: row ids are split into 2^16 chunks, a chunk holds a sorted uint16 array
+# while sparse and switches to a 1024-word bitset once it passes 4096 members
+CHUNK_BITS = 16
+ARRAY_MAX = 4096
+BITSET_WORDS = (1 << CHUNK_BITS) // 64
+
+def _to_bitset(values):
+    words = np.zeros(BITSET_WORDS, dtype=np.uint64)
+    values = values.astype(np.uint64)
+    np.bitwise_or.at(words, (values >> np.uint64(6)).astype(np.int64), np.uint64(1) << (values & np.uint64(63)))
+    return words
+
+def _from_bitset(words):
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder='little')).astype(np.uint16)
+
+def _container(values):
+    # values: sorted unique uint16
+    return values if len(values) <= ARRAY_MAX else _to_bitset(values)
+
+def _is_bitset(container):
+    return container.dtype == np.uint64
+
+def _cardinality(container):
+    return int(np.unpackbits(container.view(np.uint8)).sum()) if _is_bitset(container) else len(container)
+
+def _values(container):
+    return _from_bitset(container) if _is_bitset(container) else container
+
+class RoaringBitmap:
+    def __init__(self, containers=None):
+        self.containers = containers if containers is not None else {}
+
+    @classmethod
+    def from_indices(cls, indices):
+        bitmap = cls()
+        bitmap.add_many(indices)
+        return bitmap
+
+    def add_many(self, indices):
+        indices = np.unique(np.asarray(indices, dtype=np.uint32))
+        if not len(indices):
+            return self
+        highs = indices >> CHUNK_BITS
+        bounds = np.flatnonzero(np.diff(highs)) + 1
+        for chunk in np.split(indices, bounds):
+            high = int(chunk[0] >> CHUNK_BITS)
+            lows = (chunk & 0xFFFF).astype(np.uint16)
+            if high in self.containers:
+                lows = np.union1d(_values(self.containers[high]), lows)
+            self.containers[high] = _container(lows)
+        return self
+
+    def __and__(self, other):
+        containers = {}
+        for high in self.containers.keys() & other.containers.keys():
+            a, b = self.containers[high], other.containers[high]
+            if _is_bitset(a) and _is_bitset(b):
+                words = a & b
+                if words.any():
+                    containers[high] = words if _cardinality(words) > ARRAY_MAX else _from_bitset(words)
+            else:
+                if _is_bitset(a):
+                    a, b = b, a
+                # array against array or bitset, probe the small array
+                if _is_bitset(b):
+                    hits = a[((b[(a >> 6).astype(np.int64)] >> (a & 63).astype(np.uint64)) & np.uint64(1)).astype(bool)]
+                else:
+                    hits = np.intersect1d(a, b, assume_unique=True)
+                if len(hits):
+                    containers[high] = hits
+        return RoaringBitmap(containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for high, b in other.containers.items():
+            if high not in containers:
+                containers[high] = b
+                continue
+            a = containers[high]
+            if _is_bitset(a) or _is_bitset(b):
+                containers[high] = (a if _is_bitset(a) else _to_bitset(a)) | (b if _is_bitset(b) else _to_bitset(b))
+            else:
+                containers[high] = _container(np.union1d(a, b))
+        return RoaringBitmap(containers)
+
+    def __len__(self):
+        return sum(_cardinality(container) for container in self.containers.values())
+
+    def to_indices(self):
+        if not self.containers:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([
+            (np.int64(high) << CHUNK_BITS) + _values(self.containers[high]).astype(np.int64)
+            for high in sorted(self.containers)
+        ])
+
+class SalesCube:
+    """
+    in-memory cube over fact_sales: dictionary-encoded dimension columns, one roaring bitmap per
+    dimension member for filtering, Sales and order_key as measures
+    """
+    def __init__(self):
+        self.n_rows = 0
+        self.sales = np.empty(0, dtype=np.float64)
+        self.order_keys = np.empty(0, dtype=np.int64)
+        self.codes = {dimension: np.empty(0, dtype=np.int32) for dimension in CUBE_DIMENSIONS}
+        self.dictionaries = {dimension: [] for dimension in CUBE_DIMENSIONS}
+        self._member_codes = {dimension: {} for dimension in CUBE_DIMENSIONS}
+        self.bitmaps = {dimension: [] for dimension in CUBE_DIMENSIONS}
+        # streaming appends grow the cube while sessions query it
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_tables(cls, tables):
+        cube = cls()
+        cube.append(tables['fact_sales'], tables)
+        return cube
+
+    def _members(self, df_fact, dimension, tables):
+        table_name, key, column = CUBE_DIMENSIONS[dimension]
+        # one member per surrogate key, even where the dim table repeats a key
+        df_dim = tables[table_name][[key, column]].drop_duplicates(subset=key)
+        if dimension == "Order Month":
+            df_dim = df_dim.assign(**{column: pd.to_datetime(df_dim[column]).dt.strftime('%Y-%m')})
+        members = df_fact[[key]].merge(df_dim, on=key, how='left')[column]
+        return members.fillna("Unknown").astype(str).to_numpy()
+
+    def append(self, df_fact, tables):
+        """
+        adds new fact rows, tables holds the dim frames (new rows may reference new members),
+        only the new rows are encoded and only the touched member bitmaps grow
+        """
+        with self._lock:
+            return self._append(df_fact, tables)
+
+    def _append(self, df_fact, tables):
+        first_row = self.n_rows
+        row_ids = np.arange(first_row, first_row + len(df_fact))
+
+        for dimension in CUBE_DIMENSIONS:
+            member_codes = self._member_codes[dimension]
+            members = self._members(df_fact, dimension, tables)
+            uniques, inverse = np.unique(members, return_inverse=True)
+
+            local_to_code = np.empty(len(uniques), dtype=np.int32)
+            for i, member in enumerate(uniques):
+                if member not in member_codes:
+                    member_codes[member] = len(self.dictionaries[dimension])
+                    self.dictionaries[dimension].append(member)
+                    self.bitmaps[dimension].append(RoaringBitmap())
+                local_to_code[i] = member_codes[member]
+
+            codes = local_to_code[inverse]
+            self.codes[dimension] = np.concatenate([self.codes[dimension], codes])
+
+            order = np.argsort(codes, kind='stable')
+            bounds = np.flatnonzero(np.diff(codes[order])) + 1
+            for rows in np.split(row_ids[order], bounds):
+                if len(rows):
+                    self.bitmaps[dimension][codes[rows[0] - first_row]].add_many(rows)
+
+        self.sales = np.concatenate([self.sales, df_fact['Sales'].to_numpy(dtype=np.float64)])
+        self.order_keys = np.concatenate([self.order_keys, df_fact['order_key'].to_numpy(dtype=np.int64)])
+        self.n_rows += len(df_fact)
+        logger.info(f"Sales cube now holds {self.n_rows} rows (+{len(df_fact)})")
+        return self
+
+    def select(self, filters=None):
+        # filters: {dimension: [members]}, members of one dimension are OR-ed, dimensions are AND-ed
+        selection = None
+        for dimension, members in (filters or {}).items():
+            member_codes = self._member_codes[dimension]
+            bitmap = RoaringBitmap()
+            for member in members:
+                if member in member_codes:
+                    bitmap = bitmap | self.bitmaps[dimension][member_codes[member]]
+            selection = bitmap if selection is None else selection & bitmap
+        return np.arange(self.n_rows) if selection is None else selection.to_indices()
+
+    def query(self, filters=None, group_by=None):
+        with self._lock:
+            return self._query(filters, group_by)
+
+    def _query(self, filters=None, group_by=None):
+        rows = self.select(filters)
+        sales = self.sales[rows]
+        order_keys = self.order_keys[rows]
+        group_by = list(group_by or [])
+
+        if not group_by:
+            return pd.DataFrame({
+                "total_sales": [sales.sum()],
+                "total_orders": [len(np.unique(order_keys))],
+                "rows": [len(rows)]
+            })
+
+        sizes = [len(self.dictionaries[dimension]) for dimension in group_by]
+        cell = np.ravel_multi_index([self.codes[dimension][rows] for dimension in group_by], sizes)
+        cells, group = np.unique(cell, return_inverse=True)
+
+        # distinct (group, order_key) pairs packed into one int64 so a flat unique does the work
+        key_span = int(order_keys.max()) + 1 if len(order_keys) else 1
+        order_groups = np.unique(group.astype(np.int64) * key_span + order_keys) // key_span
+        df = pd.DataFrame({
+            dimension: np.asarray(self.dictionaries[dimension], dtype=object)[codes]
+            for dimension, codes in zip(group_by, np.unravel_index(cells, sizes))
+        })
+        df["total_sales"] = np.bincount(group, weights=sales, minlength=len(cells))
+        df["total_orders"] = np.bincount(order_groups, minlength=len(cells))
+        df["rows"] = np.bincount(group, minlength=len(cells))
+        return df.sort_values("total_sales", ascending=False, ignore_index=True)
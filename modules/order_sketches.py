@@ -0,0 +1,292 @@
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from google.cloud import bigquery
+from dotenv import load_dotenv
+from modules.clustering_and_partitioning import CLUSTERED_TABLE, PARTITION_LOG_TABLE
+
+env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
+load_dotenv(env_path)
+
+PROJECT_ID = os.getenv('PROJECT_ID')
+DATASET_ID = os.getenv('DATASET_ID')
+
+client = bigquery.Client()
+
+log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
+
+logging.basicConfig(
+    filename=log_file_path,
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+# BigQuery's HLL_COUNT accepts precisions 10..24, the local sketches use the same range
+# so an error bound means the same thing on both sides
+MIN_PRECISION = 10
+MAX_PRECISION = 24
+DEFAULT_RELATIVE_ERROR = 0.01
+
+# sketch table -> dimension key the order_key sketches are grouped by (besides the day)
+SKETCH_TABLES = {
+    "sketch_orders_daily": None,
+    "sketch_orders_daily_by_product": "product_key",
+    "sketch_orders_daily_by_region": "region_key",
+    "sketch_orders_daily_by_customer": "customer_key"
+}
+
+def precision_for_error(relative_error=DEFAULT_RELATIVE_ERROR):
+    # standard error of HLL is ~1.04 / sqrt(2^p)
+    precision = math.ceil(math.log2((1.04 / relative_error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+def _hash64(keys):
+    # splitmix64 finaliser, good enough avalanche for integer surrogate keys
+    x = np.asarray(keys).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    return x
+
+def _bit_length(x):
+    length = np.zeros(x.shape, dtype=np.int64)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = (x >> np.uint64(shift)) != 0
+        x = np.where(high, x >> np.uint64(shift), x)
+        length += high * shift
+    return length + (x != 0)
+
+class HyperLogLog:
+    def __init__(self, precision=None, relative_error=DEFAULT_RELATIVE_ERROR):
+        self.precision = precision if precision is not None else precision_for_error(relative_error)
+        if not MIN_PRECISION <= self.precision <= MAX_PRECISION:
+            raise ValueError(f"precision must be between {MIN_PRECISION} and {MAX_PRECISION}, got {self.precision}")
+        self.registers = np.zeros(1 << self.precision, dtype=np.uint8)
+
+    @property
+    def relative_error(self):
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def add(self, keys):
+        hashes = _hash64(np.atleast_1d(keys))
+        suffix_bits = 64 - self.precision
+        index = (hashes >> np.uint64(suffix_bits)).astype(np.int64)
+        suffix = hashes & np.uint64((1 << suffix_bits) - 1)
+        rank = (suffix_bits - _bit_length(suffix) + 1).astype(np.uint8)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"cannot merge sketches with precision {self.precision} and {other.precision}")
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        # linear counting is more accurate while most registers are still empty
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+def build_order_sketches(df_fact, df_orders, dimension_key=None, relative_error=DEFAULT_RELATIVE_ERROR):
+    """
+    builds one order_key sketch per (order date, dimension member) from the local fact/dim frames,
+    dimension_key=None gives plain per-day sketches (member is None)
+    """
+    precision = precision_for_error(relative_error)
+    df = df_fact.merge(df_orders[['order_key', 'Order Date']], on='order_key', how='inner')
+    group_cols = ['Order Date'] if dimension_key is None else ['Order Date', dimension_key]
+
+    sketches = {}
+    for group, df_group in df.groupby(group_cols):
+        if dimension_key is None:
+            key = (group[0] if isinstance(group, tuple) else group, None)
+        else:
+            key = group
+        sketches[key] = HyperLogLog(precision).add(df_group['order_key'].to_numpy())
+
+    logger.info(f"Built {len(sketches)} local order sketches at precision {precision}")
+    return sketches
+
+def approx_distinct_orders(sketches, start_date=None, end_date=None, group_by=None):
+    """
+    merges (date, member) sketches inside the date range,
+    group_by maps (date, member) to a label and returns {label: estimate}, otherwise a single estimate
+    """
+    merged = {}
+    for (order_date, member), sketch in sketches.items():
+        if start_date is not None and order_date < start_date:
+            continue
+        if end_date is not None and order_date > end_date:
+            continue
+        label = group_by(order_date, member) if group_by is not None else None
+        merged[label] = merged[label].merge(sketch) if label in merged else sketch
+
+    if group_by is None:
+        return merged[None].count() if merged else 0
+    return {label: sketch.count() for label, sketch in merged.items()}
+
+def create_order_sketches(relative_error=DEFAULT_RELATIVE_ERROR, table_names=None, precision=None):
+    """
+    keeps the sketch tables in step with the partitioned, clustered fact table: a missing table, one at
+    another precision or one older than the fact table's last full rebuild is rebuilt, otherwise only the order dates
+    rewritten in the partition log since the sketches were last written are re-sketched
+    """
+    precision = int(precision) if precision is not None else precision_for_error(relative_error)
+    dataset = f"{PROJECT_ID}.{DATASET_ID}"
+
+    created = []
+    for table_name, dimension_key in SKETCH_TABLES.items():
+        if table_names is not None and table_name not in table_names:
+            continue
+        dimension_col = f"{dimension_key}," if dimension_key else ""
+        sketch_select = f"""SELECT
+            order_date,
+            {dimension_col}
+            {precision} AS sketch_precision,
+            HLL_COUNT.INIT(order_key, {precision}) AS order_sketch
+        FROM `{dataset}.{CLUSTERED_TABLE}`"""
+        group_by = f"GROUP BY order_date {', ' + dimension_key if dimension_key else ''}"
+        script = f"""
+        DECLARE sketched_at TIMESTAMP DEFAULT (
+            SELECT TIMESTAMP_MILLIS(last_modified_time) FROM `{dataset}.__TABLES__` WHERE table_id = '{table_name}');
+        DECLARE source_created_at TIMESTAMP DEFAULT (
+            SELECT TIMESTAMP_MILLIS(creation_time) FROM `{dataset}.__TABLES__` WHERE table_id = '{CLUSTERED_TABLE}');
+        DECLARE sketched_precision INT64;
+        DECLARE changed_days ARRAY<DATE> DEFAULT [];
+
+        IF EXISTS (SELECT 1 FROM `{dataset}.INFORMATION_SCHEMA.COLUMNS`
+                   WHERE table_name = '{table_name}' AND column_name = 'sketch_precision') THEN
+            SET sketched_precision = (SELECT ANY_VALUE(sketch_precision) FROM `{dataset}.{table_name}`);
+        END IF;
+
+        IF sketched_precision IS NULL OR sketched_precision != {precision} OR source_created_at > sketched_at
+            OR EXISTS (SELECT 1 FROM `{dataset}.{PARTITION_LOG_TABLE}` WHERE change_type = 'rebuilt' AND rewritten_at > sketched_at) THEN
+            CREATE OR REPLACE TABLE `{dataset}.{table_name}` AS
+            {sketch_select}
+            {group_by};
+            SELECT 'rebuilt' AS mode, NULL AS changed_days;
+        ELSE
+            -- a variable rather than a subquery, so the read of the clustered table prunes to these partitions
+            SET changed_days = (
+                SELECT IFNULL(ARRAY_AGG(DISTINCT order_date IGNORE NULLS), []) FROM `{dataset}.{PARTITION_LOG_TABLE}`
+                WHERE rewritten_at > sketched_at);
+
+            DELETE FROM `{dataset}.{table_name}` WHERE order_date IN UNNEST(changed_days);
+
+            INSERT INTO `{dataset}.{table_name}`
+            {sketch_select}
+            WHERE order_date IN UNNEST(changed_days)
+            {group_by};
+            SELECT 'incremental' AS mode, ARRAY_LENGTH(changed_days) AS changed_days;
+        END IF;"""
+        try:
+            mode, changed_days = client.query(script).to_dataframe().iloc[0]
+            if mode == 'rebuilt':
+                logger.info(f"Sketch table '{table_name}' rebuilt at precision {precision}.")
+            else:
+                logger.info(f"Sketch table '{table_name}' re-sketched {changed_days} changed day(s).")
+            created.append(table_name)
+        except Exception as e:
+            logger.error(f"Error creating sketch table '{table_name}': {e}")
+
+    return created
+
+def _approx_rollup_queries():
+    date_filter = "(@start_date IS NULL OR s.order_date >= @start_date) AND (@end_date IS NULL OR s.order_date <= @end_date)"
+    return {
+        "agg_sales_monthly": f"""
+        SELECT
+            EXTRACT(YEAR FROM s.order_date) AS order_year,
+            EXTRACT(MONTH FROM s.order_date) AS order_month,
+            HLL_COUNT.MERGE(s.order_sketch) AS total_orders
+        FROM `{PROJECT_ID}.{DATASET_ID}.sketch_orders_daily` s
+        WHERE {date_filter}
+        GROUP BY order_year, order_month
+        ORDER BY order_year, order_month""",
+
+        "agg_sales_product": f"""
+        SELECT
+            s.product_key,
+            p.`Product Name` AS product_name,
+            p.`Category` AS category,
+            p.`Sub-Category` AS sub_category,
+            HLL_COUNT.MERGE(s.order_sketch) AS total_orders
+        FROM `{PROJECT_ID}.{DATASET_ID}.sketch_orders_daily_by_product` s
+        LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_products` p
+            ON s.product_key = p.product_key
+        WHERE {date_filter}
+        GROUP BY s.product_key, p.`Product Name`, p.`Category`, p.`Sub-Category`
+        ORDER BY total_orders DESC""",
+
+        "agg_revenue_region": f"""
+        SELECT
+            r.state AS region,
+            HLL_COUNT.MERGE(s.order_sketch) AS total_orders
+        FROM `{PROJECT_ID}.{DATASET_ID}.sketch_orders_daily_by_region` s
+        LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_regions` r
+            ON s.region_key = r.region_key
+        WHERE {date_filter}
+        GROUP BY r.state
+        ORDER BY total_orders DESC""",
+
+        "mart_inventory_analysis": f"""
+        SELECT
+            p.`Category`,
+            p.`Sub-Category`,
+            HLL_COUNT.MERGE(s.order_sketch) AS total_orders
+        FROM `{PROJECT_ID}.{DATASET_ID}.sketch_orders_daily_by_product` s
+        JOIN `{PROJECT_ID}.{DATASET_ID}.dim_products` p
+            ON s.product_key = p.product_key
+        WHERE {date_filter}
+        GROUP BY p.`Category`, p.`Sub-Category`""",
+
+        "kpi_avg_order_frequency_by_customer": f"""
+        SELECT
+            c.`Customer Name`,
+            HLL_COUNT.MERGE(s.order_sketch) / COUNT(DISTINCT s.order_date) AS avg_order_frequency
+        FROM `{PROJECT_ID}.{DATASET_ID}.sketch_orders_daily_by_customer` s
+        LEFT JOIN `{PROJECT_ID}.{DATASET_ID}.dim_customers` c
+            ON s.customer_key = c.customer_key
+        WHERE {date_filter}
+        GROUP BY c.`Customer Name`"""
+    }
+
+APPROX_ROLLUPS = list(_approx_rollup_queries())
+
+def fetch_approx_rollup(rollup_name, start_date=None, end_date=None):
+    try:
+        query = _approx_rollup_queries()[rollup_name]
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("start_date", "DATE", start_date),
+            bigquery.ScalarQueryParameter("end_date", "DATE", end_date)
+        ])
+        df = client.query(query, job_config=job_config).to_dataframe()
+        logger.info(f"Fetched approximate rollup: {rollup_name}")
+        return df
+    except Exception as e:
+        logger.error(f"Error fetching approximate rollup '{rollup_name}': {e}")
+        return None
+
+def iter_approx_rollups(start_date=None, end_date=None, max_workers=len(APPROX_ROLLUPS)):
+    # rollups only read the small sketch tables, so they are fetched concurrently like the procedures
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_approx_rollup, rollup_name, start_date, end_date): rollup_name
+            for rollup_name in APPROX_ROLLUPS
+        }
+        for future in as_completed(futures):
+            df = future.result()
+            if df is not None:
+                yield futures[future], df
@@ -0,0 +1,167 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import CancelledError, ThreadPoolExecutor, wait
+
+log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
+
+logging.basicConfig(
+    filename=log_file_path,
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+class Prefetcher:
+    """
+    result cache shared by all sessions plus a bounded background pool that warms it,
+    keys map to zero-arg loaders (e.g. ("mart", "mart_order_fulfillment") -> fetch function)
+    """
+    def __init__(self, max_workers=2, max_entries=64, ttl_seconds=600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        # key -> (value, stored_at, load_seconds, prefetched and not used yet)
+        self._results = OrderedDict()
+        self._pending = {}
+        # pending key -> requesters still waiting on it, a queued prefetch is only dropped once none are left
+        self._requesters = {}
+        self.metrics = {
+            "hits": 0,
+            "misses": 0,
+            "joined": 0,
+            "prefetched": 0,
+            "cancelled": 0,
+            "wasted": 0,
+            "prefetch_seconds": 0.0,
+            "saved_seconds": 0.0
+        }
+
+    def _store(self, key, value, load_seconds, prefetched):
+        # caller holds the lock
+        self._results[key] = (value, time.monotonic(), load_seconds, prefetched)
+        self._results.move_to_end(key)
+        while len(self._results) > self._max_entries:
+            _, (_, _, _, unused) = self._results.popitem(last=False)
+            self.metrics["wasted"] += unused
+
+    def _lookup(self, key):
+        # caller holds the lock
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self._ttl_seconds:
+            del self._results[key]
+            self.metrics["wasted"] += entry[3]
+            return None
+        self._results.move_to_end(key)
+        return entry
+
+    def _prefetch_one(self, key, loader):
+        start = time.perf_counter()
+        try:
+            value = loader()
+        except Exception as e:
+            logger.error(f"Prefetch of {key} failed: {e}")
+            value = None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._pending.pop(key, None)
+            self._requesters.pop(key, None)
+            self.metrics["prefetch_seconds"] += elapsed
+            if value is not None:
+                self.metrics["prefetched"] += 1
+                self._store(key, value, elapsed, True)
+        return value
+
+    def prefetch(self, loaders, cancel_others=True, requester=None):
+        """
+        warms the cache for loaders ({key: loader}) in the background; with cancel_others, queued
+        prefetches this requester (e.g. a session) asked for earlier and no longer needs are dropped,
+        unless another requester still wants them (running ones finish)
+        """
+        with self._lock:
+            if cancel_others:
+                for key, future in list(self._pending.items()):
+                    requesters = self._requesters.get(key, set())
+                    if key in loaders or requester not in requesters:
+                        continue
+                    requesters.discard(requester)
+                    if not requesters and future.cancel():
+                        del self._pending[key]
+                        del self._requesters[key]
+                        self.metrics["cancelled"] += 1
+            for key, loader in loaders.items():
+                if key in self._pending:
+                    self._requesters.setdefault(key, set()).add(requester)
+                    continue
+                if self._lookup(key) is not None:
+                    continue
+                self._pending[key] = self._executor.submit(self._prefetch_one, key, loader)
+                self._requesters[key] = {requester}
+
+    def get(self, key, loader):
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                value, _, load_seconds, unused = entry
+                self.metrics["hits"] += 1
+                if unused:
+                    self.metrics["saved_seconds"] += load_seconds
+                    self._results[key] = (value, entry[1], load_seconds, False)
+                return value
+            future = self._pending.get(key)
+
+        if future is not None:
+            # already loading in the background, waiting still beats starting over
+            try:
+                value = future.result()
+            except CancelledError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.metrics["joined"] += 1
+                    entry = self._results.get(key)
+                    if entry is not None and entry[3]:
+                        self._results[key] = (value, entry[1], entry[2], False)
+                return value
+
+        start = time.perf_counter()
+        value = loader()
+        with self._lock:
+            self.metrics["misses"] += 1
+            if value is not None:
+                self._store(key, value, time.perf_counter() - start, False)
+        return value
+
+    def wait_idle(self, timeout=None):
+        # blocks until no prefetch is queued or running, returns False if timeout ran out first
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                futures = list(self._pending.values())
+            if not futures:
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            wait(futures, timeout=remaining)
+
+    def invalidate(self, predicate=None):
+        # drops cached results (all, or those whose key matches predicate), e.g. after new data is pushed
+        with self._lock:
+            for key in [key for key in self._results if predicate is None or predicate(key)]:
+                self.metrics["wasted"] += self._results.pop(key)[3]
+
+    def snapshot(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics["pending"] = len(self._pending)
+            metrics["cached"] = len(self._results)
+        lookups = metrics["hits"] + metrics["joined"] + metrics["misses"]
+        metrics["hit_rate"] = (metrics["hits"] + metrics["joined"]) / lookups if lookups else 0.0
+        return metrics
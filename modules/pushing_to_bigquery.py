@@ -20,16 +20,19 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-def push_to_bigquery(tables_dict):
+def push_to_bigquery(tables_dict, if_exists="replace"):
+    # if_exists="append" adds the rows to the existing tables through load jobs (the streaming ingest path)
     try:
         client = bigquery.Client(project=PROJECT_ID)
         
         for table_name, df in tables_dict.items():
             logger.info(f"Pushing {table_name} to BigQuery...")
-            pandas_gbq.to_gbq(df, f"{DATASET_ID}.{table_name}", project_id=PROJECT_ID, if_exists="replace")
+            pandas_gbq.to_gbq(df, f"{DATASET_ID}.{table_name}", project_id=PROJECT_ID, if_exists=if_exists)
             logger.info(f"Table {table_name} uploaded successfully.")
 
         logger.info("All tables pushed to BigQuery.")
+        return True
     
     except Exception as e:
-        logger.error(f"Error pushing tables to BigQuery: {e}")
\ No newline at end of file
+        logger.error(f"Error pushing tables to BigQuery: {e}")
+        return False
\ No newline at end of file
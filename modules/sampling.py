@@ -0,0 +1,93 @@
+import logging
+import math
+import os
+from dotenv import load_dotenv
+from modules.single_flight import run_query
+
+env_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".env"))
+load_dotenv(env_path)
+
+PROJECT_ID = os.getenv('PROJECT_ID')
+DATASET_ID = os.getenv('DATASET_ID')
+
+log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
+
+logging.basicConfig(
+    filename=log_file_path,
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_PERCENT = 10
+
+# script-scoped temp table the sampled SELECTs read instead of fact_sales
+SAMPLED_FACT_TABLE = "sampled_fact_sales"
+
+SAMPLE_STAT_COLUMNS = ["sample_rows", "sample_sales", "sample_sales_sq", "sample_total_rows"]
+
+def _sample_clause(sample_percent, sample_by):
+    if sample_by is None:
+        return f"TABLESAMPLE SYSTEM ({sample_percent} PERCENT)"
+    # every row of a sampled key is kept, so per-key figures stay exact
+    return f"WHERE MOD(ABS(FARM_FINGERPRINT(CAST({sample_by} AS STRING))), 10000) < {int(sample_percent * 100)}"
+
+def run_sampled_query(client, select, sample_percent, scaled_columns=(), sample_by=None):
+    """
+    runs select (reading SAMPLED_FACT_TABLE) over one sample of fact_sales: storage blocks by default,
+    or whole groups of rows sharing a sample_by key (e.g. order_key for per-order queries).
+    Only scaled_columns (SUMs and plain COUNTs over the sample) are scaled by the fraction actually
+    read, distinct counts, averages and per-key figures are left as measured.
+    df.attrs["sampling"] carries the fraction and the error indicator
+    """
+    script = f"""
+    CREATE TEMP TABLE {SAMPLED_FACT_TABLE} AS
+    SELECT * FROM `{PROJECT_ID}.{DATASET_ID}.fact_sales` {_sample_clause(sample_percent, sample_by)};
+
+    CREATE TEMP TABLE sample_stats AS
+    SELECT
+        COUNT(*) AS sample_rows,
+        SUM(Sales) AS sample_sales,
+        SUM(Sales * Sales) AS sample_sales_sq,
+        (SELECT row_count FROM `{PROJECT_ID}.{DATASET_ID}.__TABLES__` WHERE table_id = 'fact_sales') AS sample_total_rows
+    FROM {SAMPLED_FACT_TABLE};
+
+    SELECT q.*, s.* FROM ({select}) q CROSS JOIN sample_stats s;
+    """
+    df = run_query(client, script, to_dataframe=True)
+    sampling = {
+        "sample_percent": sample_percent,
+        "sampled_by": sample_by or "block",
+        "scaled_columns": [column for column in scaled_columns if column in df.columns],
+        "sampled_fraction": 0.0,
+        "total_sales_error_95": None
+    }
+    if df.empty:
+        df = df.drop(columns=SAMPLE_STAT_COLUMNS, errors="ignore")
+        df.attrs["sampling"] = sampling
+        return df
+
+    stats = df.iloc[0][SAMPLE_STAT_COLUMNS]
+    df = df.drop(columns=SAMPLE_STAT_COLUMNS)
+    fraction = stats["sample_rows"] / stats["sample_total_rows"] if stats["sample_total_rows"] else 1.0
+
+    # block sampling on small tables can hand back far more (or less) than asked, so scale by what was read
+    for column in sampling["scaled_columns"]:
+        df[column] = df[column] / fraction
+
+    sampling["sampled_fraction"] = float(fraction)
+    if sampling["scaled_columns"]:
+        sampling["total_sales_error_95"] = sampling_error(fraction, stats["sample_sales"], stats["sample_sales_sq"])
+    df.attrs["sampling"] = sampling
+    return df
+
+def sampling_error(fraction, sampled_sum, sampled_sum_sq):
+    """
+    95% relative error of the whole-table Sales total scaled up from a sample, var(sum / f) ~ (1 - f) / f^2 * sum(x^2)
+    for independently sampled rows; block sampling clusters rows, so read it as a lower bound.
+    A group holding a share g of the sales has roughly 1 / sqrt(g) times this error
+    """
+    if not sampled_sum:
+        return 1.0
+    return float(1.96 * math.sqrt(max(1 - fraction, 0.0) * sampled_sum_sq) / sampled_sum)
@@ -0,0 +1,83 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future
+
+log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
+
+logging.basicConfig(
+    filename=log_file_path,
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    process-wide duplicate suppression: while a call for a key is running, further calls with the
+    same key wait for it and get its result (or its exception) instead of running again
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.metrics = {
+            "executed": 0,
+            "coalesced": 0
+        }
+
+    def do(self, key, fn):
+        # returns (result, shared), shared is True for callers that joined someone else's call
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.metrics["executed"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            # later callers start a fresh job, a statement submitted after this one finished may see newer data
+            with self._lock:
+                del self._in_flight[key]
+
+    def snapshot(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics["in_flight"] = len(self._in_flight)
+        return metrics
+
+_flight = SingleFlight()
+
+def run_query(client, query, to_dataframe=False):
+    """
+    submits query unless the identical statement is already running in this process, in which case
+    the caller waits for that job; with to_dataframe every waiter gets its own copy of the rows
+    """
+    def execute():
+        job = client.query(query)
+        return job.to_dataframe() if to_dataframe else job.result()
+
+    result, shared = _flight.do((query, to_dataframe), execute)
+    if shared:
+        logger.info(f"Joined in-flight query instead of re-submitting it: {query.strip()[:80]}")
+        if to_dataframe:
+            return result.copy()
+    return result
+
+def coalesced_count():
+    return _flight.snapshot()["coalesced"]
+
+def snapshot():
+    return _flight.snapshot()
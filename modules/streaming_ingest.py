@@ -0,0 +1,422 @@
+import glob
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from modules.aggregation_tabs import AGGREGATION_PROCEDURES
+from modules.clustering_and_partitioning import STAGED_APPENDS_TABLE
+from modules.data_extraction_and_transformation import create_fact_and_dimensions, preprocess_records
+from modules.data_mart_tabs import fetch_data_mart
+from modules.kpi_tabs import KPI_PROCEDURES
+from modules.lineage import fetch_table_versions, refresh_stale
+from modules.pushing_to_bigquery import push_to_bigquery
+
+log_file_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "etl_pipeline.log"))
+
+logging.basicConfig(
+    filename=log_file_path,
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+logger = logging.getLogger(__name__)
+
+# dim table -> (natural key, surrogate key), as built by create_fact_and_dimensions
+DIM_KEYS = {
+    "dim_orders": ("Order ID", "order_key"),
+    "dim_shipping": ("Ship Date", "ship_key"),
+    "dim_customers": ("Customer ID", "customer_key"),
+    "dim_regions": ("Postal Code", "region_key"),
+    "dim_products": ("Product ID", "product_key")
+}
+
+DATE_COLUMNS = ["Order Date", "Ship Date"]
+
+# every KPI and aggregate reads fact_sales, so each appended batch makes all of them stale
+STREAMING_REFRESH_TARGETS = list(KPI_PROCEDURES.values()) + list(AGGREGATION_PROCEDURES.values())
+
+def _normalized_column(values, column):
+    if column in DATE_COLUMNS:
+        return pd.to_datetime(values).dt.strftime('%Y-%m-%d')
+    # numbers compare by value, 42420, 42420.0 (FLOAT column) and "42420" are one member
+    numbers = pd.to_numeric(values, errors='coerce')
+    return values.astype(str).where(numbers.isna(), numbers.map(lambda number: f"{number:.15g}"))
+
+def _normalized(df, columns):
+    # string form of the given columns, so warehouse dtypes (dbdate, FLOAT, Int64) compare equal to fresh pandas values
+    return pd.DataFrame({column: _normalized_column(df[column], column) for column in columns}, index=df.index)
+
+def _percentiles(values):
+    if not values:
+        return {"p50_s": None, "p95_s": None, "max_s": None}
+    values = np.asarray(values)
+    return {
+        "p50_s": round(float(np.percentile(values, 50)), 3),
+        "p95_s": round(float(np.percentile(values, 95)), 3),
+        "max_s": round(float(values.max()), 3)
+    }
+
+class DimensionKeys:
+    """
+    surrogate keys already handed out in the warehouse, so micro-batches reuse the key of a known
+    member and give new members max + 1 instead of the batch-local codes create_fact_and_dimensions makes
+    """
+    def __init__(self, table_name, df_dim=None):
+        self.table_name = table_name
+        self.natural_key, self.key = DIM_KEYS[table_name]
+        self.key_map = {}
+        self.rows = set()
+        self.next_key = 0
+        if df_dim is not None and not df_dim.empty:
+            self._remember(df_dim)
+
+    def _remember(self, df_dim):
+        naturals = _normalized(df_dim, [self.natural_key])[self.natural_key]
+        self.key_map.update(zip(naturals, df_dim[self.key].astype(int)))
+        self.rows.update(map(tuple, _normalized(df_dim, df_dim.columns).itertuples(index=False)))
+        self.next_key = max(self.next_key, int(df_dim[self.key].max()) + 1)
+
+    def assign(self, df_dim):
+        """
+        returns (batch-local key -> warehouse key, dim rows the warehouse does not have yet); nothing is
+        remembered until commit, so a failed append hands out the same keys again on retry
+        """
+        naturals = _normalized(df_dim, [self.natural_key])[self.natural_key]
+        new_naturals = [natural for natural in naturals.unique() if natural not in self.key_map]
+        new_keys = dict(zip(new_naturals, range(self.next_key, self.next_key + len(new_naturals))))
+
+        global_keys = naturals.map(lambda natural: self.key_map.get(natural, new_keys.get(natural)))
+        local_to_global = dict(zip(df_dim[self.key], global_keys))
+
+        df_dim = df_dim.assign(**{self.key: global_keys.astype("int64")})
+        unseen = [row not in self.rows for row in map(tuple, _normalized(df_dim, df_dim.columns).itertuples(index=False))]
+        return local_to_global, df_dim[unseen]
+
+    def commit(self, df_new_rows):
+        if not df_new_rows.empty:
+            self._remember(df_new_rows)
+
+class StreamingIngest:
+    """
+    micro-batch ingest of new order rows: a drop directory watcher (or submit() as a local queue
+    stand-in) feeds a bounded queue, batches run through preprocess_records and
+    create_fact_and_dimensions with warehouse-consistent keys, get appended to BigQuery, and the
+    affected KPIs / aggregates are refreshed in the background
+    """
+    def __init__(self, drop_dir=None, poll_interval=1.0, max_queue=16, max_batch_rows=5000,
+                 max_batch_delay=2.0, refresh_targets=None, on_refresh=None, on_append=None, refresh_workers=4):
+        self.drop_dir = drop_dir
+        self.poll_interval = poll_interval
+        self.max_batch_rows = max_batch_rows
+        self.max_batch_delay = max_batch_delay
+        self.refresh_targets = refresh_targets or STREAMING_REFRESH_TARGETS
+        self.on_refresh = on_refresh
+        # called with (df_fact, {dim table: new rows}, fact_sales version) after every appended batch
+        self.on_append = on_append
+        self.refresh_workers = refresh_workers
+
+        # bounded, a full queue stops the watcher picking up files and makes submit() block or fail
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._refresh_needed = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._claimed = set()
+        self._dims = None
+        self._dim_versions = {}
+        self._dims_lock = threading.Lock()
+        # arrival times of appended rows waiting for the next KPI refresh
+        self._awaiting_refresh = []
+        self._append_lags = deque(maxlen=1000)
+        self._end_to_end_lags = deque(maxlen=1000)
+        self.metrics = {
+            "files": 0,
+            "failed_files": 0,
+            "submitted": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "rows_appended": 0,
+            "refreshes": 0,
+            "failed_refreshes": 0,
+            "backpressure_waits": 0,
+            "rejected": 0
+        }
+
+    def _dimension_versions(self):
+        versions = fetch_table_versions()
+        return {table_name: versions.get(table_name) for table_name in DIM_KEYS}
+
+    def reload_dimensions(self):
+        # re-reads the surrogate keys of every dim table, e.g. right after a full push replaced them
+        with self._dims_lock:
+            self._load_dimensions()
+
+    def _load_dimensions(self):
+        # caller holds _dims_lock, or nothing is ingesting yet
+        try:
+            dim_versions = self._dimension_versions()
+        except Exception as e:
+            logger.error(f"Could not read dim table versions: {e}")
+            dim_versions = {}
+        dims = {}
+        for table_name in DIM_KEYS:
+            df_dim = fetch_data_mart(table_name)
+            if df_dim is None:
+                logger.warning(f"{table_name} could not be read, new members are keyed from 0")
+            dims[table_name] = DimensionKeys(table_name, df_dim)
+        self._dims, self._dim_versions = dims, dim_versions
+        logger.info("Streaming ingest loaded dim table keys")
+
+    def _ensure_current_dimensions(self):
+        # another writer (a full push from the dashboard or batch_pipeline) changes the dim tables under us
+        try:
+            dim_versions = self._dimension_versions()
+        except Exception as e:
+            logger.warning(f"Could not check dim table versions, keeping the loaded keys: {e}")
+            return
+        if self._dims is None or dim_versions != self._dim_versions:
+            self._load_dimensions()
+
+    def start(self):
+        if self._dims is None:
+            self._load_dimensions()
+        workers = [self._ingest_loop, self._refresh_loop] + ([self._watch_loop] if self.drop_dir else [])
+        for target in workers:
+            thread = threading.Thread(target=target, name=f"streaming-{target.__name__.strip('_')}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Streaming ingest started{f' on {self.drop_dir}' if self.drop_dir else ''}")
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._refresh_needed.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        logger.info("Streaming ingest stopped")
+
+    def _enqueue(self, item, timeout=None):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.metrics["backpressure_waits"] += 1
+            self._queue.put(item, timeout=timeout)
+
+    def submit(self, records, timeout=None):
+        """
+        queues raw order rows (DataFrame or list of dicts, same columns as train.csv); blocks while the
+        queue is full, raises queue.Full if it stays full for timeout seconds
+        """
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+        try:
+            self._enqueue((df, time.time(), None), timeout)
+        except queue.Full:
+            with self._lock:
+                self.metrics["rejected"] += 1
+            raise
+        with self._lock:
+            self.metrics["submitted"] += 1
+
+    def _watch_loop(self):
+        os.makedirs(self.drop_dir, exist_ok=True)
+        while not self._stop.is_set():
+            paths = [path for path in glob.glob(os.path.join(self.drop_dir, "*.csv")) if path not in self._claimed]
+            for path in sorted(paths, key=os.path.getmtime):
+                if self._stop.is_set():
+                    break
+                try:
+                    df = pd.read_csv(path)
+                except Exception as e:
+                    logger.error(f"Could not read dropped file {path}: {e}")
+                    self._archive(path, "failed")
+                    continue
+                self._claimed.add(path)
+                # a file's arrival is when it landed, not when the watcher got to it
+                item = (df, os.path.getmtime(path), path)
+                while not self._stop.is_set():
+                    try:
+                        self._enqueue(item, timeout=self.poll_interval)
+                        break
+                    except queue.Full:
+                        continue
+            self._stop.wait(self.poll_interval)
+
+    def _archive(self, path, outcome):
+        # processed files leave the drop directory so a restart does not append them twice
+        target_dir = os.path.join(self.drop_dir, outcome)
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+            shutil.move(path, os.path.join(target_dir, os.path.basename(path)))
+        except OSError as e:
+            logger.error(f"Could not move {path} to {target_dir}: {e}")
+            # still claimed while it is there, an unmoved processed file must not be appended twice
+            if os.path.exists(path):
+                return
+        self._claimed.discard(path)
+        with self._lock:
+            self.metrics["files" if outcome == "processed" else "failed_files"] += 1
+
+    def _next_batch(self):
+        try:
+            items = [self._queue.get(timeout=self.poll_interval)]
+        except queue.Empty:
+            return []
+        rows = len(items[0][0])
+        deadline = time.monotonic() + self.max_batch_delay
+        while rows < self.max_batch_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                items.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+            rows += len(items[-1][0])
+        return items
+
+    def _ingest_loop(self):
+        while not self._stop.is_set():
+            items = self._next_batch()
+            if not items:
+                continue
+            try:
+                appended = self.ingest_batch(pd.concat([df for df, _, _ in items], ignore_index=True))
+            except Exception as e:
+                # an unexpected error must not end the thread, the watcher would fill the queue and stall
+                logger.error(f"Micro-batch of {len(items)} item(s) failed: {e}")
+                with self._lock:
+                    self.metrics["failed_batches"] += 1
+                appended = False
+            for _, _, path in items:
+                if path is not None:
+                    self._archive(path, "processed" if appended else "failed")
+            if not appended:
+                continue
+
+            appended_at = time.time()
+            with self._lock:
+                for _, arrived_at, _ in items:
+                    self._append_lags.append(appended_at - arrived_at)
+                    self._awaiting_refresh.append(arrived_at)
+            self._refresh_needed.set()
+
+    def ingest_batch(self, df_raw):
+        """
+        preprocesses, models and appends one micro-batch, returns True once fact rows are in the warehouse
+        """
+        start = time.perf_counter()
+        df = preprocess_records(df_raw)
+        df_fact, *dim_frames = create_fact_and_dimensions(df) if df is not None else (None,) * 6
+        if df_fact is None:
+            with self._lock:
+                self.metrics["failed_batches"] += 1
+            return False
+
+        with self._dims_lock:
+            return self._append_batch(df_fact, dim_frames, start)
+
+    def _append_batch(self, df_fact, dim_frames, start):
+        # caller holds _dims_lock, keys are handed out and committed by one batch at a time
+        self._ensure_current_dimensions()
+        # looked up on the batch-local keys, the staged layouts take only these rows' days
+        df_orders = dim_frames[0]
+        order_dates = df_fact["order_key"].map(dict(zip(df_orders["order_key"], df_orders["Order Date"])))
+        new_dims = {}
+        for table_name, df_dim in zip(DIM_KEYS, dim_frames):
+            local_to_global, new_dims[table_name] = self._dims[table_name].assign(df_dim)
+            key = DIM_KEYS[table_name][1]
+            df_fact[key] = df_fact[key].map(local_to_global).astype("int64")
+
+        # dims go first, appended fact rows never reference a member the warehouse has not got
+        new_dims = {table_name: df_dim for table_name, df_dim in new_dims.items() if not df_dim.empty}
+        if new_dims and not push_to_bigquery(new_dims, if_exists="append"):
+            with self._lock:
+                self.metrics["failed_batches"] += 1
+            return False
+        for table_name, df_dim in new_dims.items():
+            self._dims[table_name].commit(df_dim)
+
+        if not push_to_bigquery({"fact_sales": df_fact}, if_exists="append"):
+            with self._lock:
+                self.metrics["failed_batches"] += 1
+            return False
+        df_staged = df_fact.assign(order_date=order_dates, batch_id=uuid.uuid4().hex)
+        if not push_to_bigquery({STAGED_APPENDS_TABLE: df_staged}, if_exists="append"):
+            logger.warning("Could not queue the batch for staging, the next staging joins fact_sales in full")
+
+        fact_version = None
+        try:
+            # our own appends move the dim versions too, only someone else's writes should trigger a reload
+            versions = fetch_table_versions()
+            fact_version = versions.get("fact_sales")
+            if new_dims:
+                self._dim_versions = {table_name: versions.get(table_name) for table_name in DIM_KEYS}
+        except Exception as e:
+            logger.warning(f"Could not read table versions after appending: {e}")
+        if self.on_append is not None:
+            try:
+                self.on_append(df_fact, new_dims, fact_version)
+            except Exception as e:
+                logger.error(f"on_append callback failed: {e}")
+
+        with self._lock:
+            self.metrics["batches"] += 1
+            self.metrics["rows_appended"] += len(df_fact)
+        logger.info(f"Appended micro-batch of {len(df_fact)} fact rows ({len(new_dims)} dim table(s) grew) in {time.perf_counter() - start:.2f}s")
+        return True
+
+    def _refresh_loop(self):
+        # targets share no derived upstreams, so each is refreshed on its own worker
+        with ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix="streaming-refresh") as executor:
+            while True:
+                self._refresh_needed.wait()
+                if self._stop.is_set():
+                    return
+                self._refresh_needed.clear()
+                with self._lock:
+                    arrivals, self._awaiting_refresh = self._awaiting_refresh, []
+                if not arrivals:
+                    continue
+
+                # rows appended while this refresh runs are picked up by the next one
+                try:
+                    rebuilt = [table for tables in executor.map(lambda target: refresh_stale([target]), self.refresh_targets) for table in tables]
+                except Exception as e:
+                    logger.error(f"Refresh of derived tables failed: {e}")
+                    with self._lock:
+                        self.metrics["failed_refreshes"] += 1
+                        # retried with the next appended batch
+                        self._awaiting_refresh = arrivals + self._awaiting_refresh
+                    continue
+                if self.on_refresh is not None:
+                    try:
+                        self.on_refresh(rebuilt)
+                    except Exception as e:
+                        logger.error(f"on_refresh callback failed: {e}")
+                        with self._lock:
+                            self.metrics["failed_refreshes"] += 1
+
+                refreshed_at = time.time()
+                with self._lock:
+                    self.metrics["refreshes"] += 1
+                    self._end_to_end_lags.extend(refreshed_at - arrived_at for arrived_at in arrivals)
+                logger.info(f"Refreshed {len(rebuilt)} derived table(s) for {len(arrivals)} arrival(s)")
+
+    def snapshot(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics["queue_depth"] = self._queue.qsize()
+            metrics["queue_capacity"] = self._queue.maxsize
+            metrics["awaiting_refresh"] = len(self._awaiting_refresh)
+            metrics["append_lag"] = _percentiles(list(self._append_lags))
+            metrics["end_to_end_lag"] = _percentiles(list(self._end_to_end_lags))
+        return metrics
@@ -0,0 +1,49 @@
+"""
+Streaming ingest: watches a drop directory for new order files and appends them to BigQuery in
+micro-batches, refreshing the KPIs and aggregates they make stale.
+
+Files must have the columns of train.csv. Write them under another name (e.g. orders.csv.tmp) and
+rename to *.csv once complete; processed files move to <drop dir>/processed, unreadable or
+rejected ones to <drop dir>/failed.
+
+The metrics line shows queue depth against capacity (the watcher stops picking up files while
+the queue is full), append lag (file landed -> rows in fact_sales) and end-to-end lag
+(file landed -> KPIs and aggregates rebuilt).
+
+usage :-
+    python stream_orders.py ./data/incoming --max-batch-rows 5000 --max-batch-delay 2 --metrics-every 10
+"""
+import argparse
+import json
+import time
+from modules.streaming_ingest import StreamingIngest
+
+def main():
+    parser = argparse.ArgumentParser(description="Append order files dropped into a directory to BigQuery as they arrive")
+    parser.add_argument("drop_dir", help="directory to watch for *.csv order files")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between directory scans")
+    parser.add_argument("--max-queue", type=int, default=16, help="files queued before the watcher backs off")
+    parser.add_argument("--max-batch-rows", type=int, default=5000, help="rows that close a micro-batch early")
+    parser.add_argument("--max-batch-delay", type=float, default=2.0, help="seconds a micro-batch waits for more files")
+    parser.add_argument("--metrics-every", type=float, default=10.0, help="seconds between metrics lines")
+    args = parser.parse_args()
+
+    ingest = StreamingIngest(
+        drop_dir=args.drop_dir,
+        poll_interval=args.poll_interval,
+        max_queue=args.max_queue,
+        max_batch_rows=args.max_batch_rows,
+        max_batch_delay=args.max_batch_delay
+    ).start()
+    print(f"Watching {args.drop_dir}, Ctrl-C to stop")
+
+    try:
+        while True:
+            time.sleep(args.metrics_every)
+            print(json.dumps(ingest.snapshot()))
+    except KeyboardInterrupt:
+        ingest.stop(timeout=30)
+        print(json.dumps(ingest.snapshot()))
+
+if __name__ == '__main__':
+    main()